@@ -3,7 +3,9 @@ from dataclasses import dataclass
 
 import gbm.api
 import gbm.auth
-from gbm.base_request import get_driver
+from gbm.base_request import get_driver, DriverPool, LazyDriver
+from gbm.transport import HTTPTransport, AsyncHTTPTransport
+from gbm.utilities import startup_timings
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +21,33 @@ class APIs:
     session: gbm.auth.Session
 
 
-def api_init(user, password=None, load_session=False):
-    driver = get_driver()
-    if load_session:
-        session = gbm.auth.Session.from_saved_session(user)
+def api_init(user, password=None, load_session=False, transport='driver',
+             pool_size=2):
+    """
+    Initialize the APIs for the user.
+
+    The transport is either 'driver', to make every call through the
+    selenium driver, 'pool' to spread the calls over a pool of pool_size
+    drivers, or 'http' to only use the driver to get the anti-bot
+    cookies and make the calls with a plain http client.
+
+    No driver is started until the first request that needs it, the time
+    spent on each phase of the startup is recorded on
+    gbm.utilities.startup_timings.
+    """
+    if transport == 'driver':
+        driver = LazyDriver(get_driver)
+    elif transport == 'pool':
+        driver = DriverPool(pool_size)
+    elif transport == 'http':
+        driver = HTTPTransport()
     else:
-        session = gbm.auth.login(user, password)
+        raise ValueError("Unknown transport: {}".format(transport))
+    with startup_timings.measure('session'):
+        if load_session:
+            session = gbm.auth.Session.from_saved_session(user)
+        else:
+            session = gbm.auth.login(user, password, driver)
     apis = {
         'v1': gbm.api.GBMAPIv1(session, driver),
         'v2': gbm.api.GBMAPIv2(session, driver),
@@ -33,3 +56,23 @@ def api_init(user, password=None, load_session=False):
         'session': session
     }
     return APIs(**apis)
+
+
+async def async_api_init(user, password=None, load_session=False):
+    """
+    Asyncio version of api_init, the calls are made with an
+    AsyncHTTPTransport and the endpoint methods return awaitables.
+    """
+    driver = AsyncHTTPTransport()
+    if load_session:
+        session = gbm.auth.Session.from_saved_session(user)
+    else:
+        session = await gbm.auth.async_login(user, password, driver)
+    apis = {
+        'v1': gbm.api.AsyncGBMAPIv1(session, driver),
+        'v2': gbm.api.AsyncGBMAPIv2(session, driver),
+        'gbmp': gbm.api.AsyncGBMPro(session, driver),
+        'auth': gbm.auth.AsyncAuthAPIv1(driver, session),
+        'session': session
+    }
+    return APIs(**apis)
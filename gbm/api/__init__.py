@@ -1,6 +1,9 @@
-from gbm.api.v1 import GBMAPIv1
-from gbm.api.v2 import GBMAPIv2
-from gbm.api.gbmp import GBMPro
+from gbm.api.v1 import GBMAPIv1, AsyncGBMAPIv1
+from gbm.api.v2 import GBMAPIv2, AsyncGBMAPIv2
+from gbm.api.gbmp import GBMPro, AsyncGBMPro
 
 
-__all__ = ['GBMAPIv1', 'GBMAPIv2', 'GBMPro']
+__all__ = [
+    'GBMAPIv1', 'GBMAPIv2', 'GBMPro',
+    'AsyncGBMAPIv1', 'AsyncGBMAPIv2', 'AsyncGBMPro'
+]
@@ -1,4 +1,31 @@
+import gbm.cache
+import gbm.columnar
+import gbm.decoding
+import gbm.ratelimit
+import gbm.urls
+from gbm.concurrency import fan_out, async_fan_out
+from gbm.exceptions import APIError
+
+
 class AbstractAPI:
+    """
+    Base of the APIs, the driver is anything with the request method of
+    seleniumrequests: a single driver, a gbm.base_request.DriverPool or one
+    of the transports of gbm.transport.
+
+    The requests go through a gbm.ratelimit.TokenBucket per host and
+    group of endpoints, the throttled requests (429/503) are retried up
+    to max_throttle_retries times.
+
+    The endpoints called with a cache_ttl are cached on self.cache, see
+    gbm.cache.ResponseCache, and the ones called with conditional=True
+    send the validators of their last response, see
+    gbm.cache.ValidatorStore.
+    """
+    _fan_out = staticmethod(fan_out)
+    max_throttle_retries = 5
+    cache = gbm.cache.default_cache
+    validators = gbm.cache.default_validators
 
     def __init__(self, session, driver):
         self.session = session
@@ -14,8 +41,8 @@ class AbstractAPI:
             "Authorization": self.session.auth_access_header
         }
 
-    def _request(
-        self, method, url_segment, params=None, json_payload=None, headers=None
+    def _request_args(
+        self, url_segment, params=None, json_payload=None, headers=None
     ):
         url = self._url_builder(url_segment)
         kwargs = {'headers': self.http_headers}
@@ -25,15 +52,105 @@ class AbstractAPI:
             kwargs['params'] = params
         if headers is not None:
             kwargs['headers'].update(headers)
-        rsp = self.driver.request(method, url, **kwargs)
-        if rsp.ok:
-            return rsp.json()
-        else:
-            raise Exception(
-                "API error: code: {}, text: {}".format(
-                    rsp.status_code, rsp.text
-                )
+        return url, kwargs
+
+    def _decode(self, rsp, output=gbm.decoding.JSON):
+        # status_code instead of ok, to support both requests and httpx
+        if rsp.status_code >= 400:
+            raise APIError(rsp.status_code, rsp.text)
+        if output == gbm.decoding.STREAM:
+            return gbm.decoding.stream_rows(rsp)
+        return gbm.decoding.decode_body(rsp.content, output)
+
+    def _send_kwargs(self, kwargs, output):
+        if output == gbm.decoding.STREAM:
+            return dict(kwargs, stream=True)
+        return kwargs
+
+    def _body_size(self, rsp, output):
+        # the streamed bodies are read by the caller
+        if output == gbm.decoding.STREAM:
+            return 0
+        return len(rsp.content)
+
+    def _limiter(self, url, url_segment):
+        return gbm.ratelimit.limiter_for(
+            gbm.urls.host_of(url), gbm.ratelimit.endpoint_group(url_segment)
+        )
+
+    def _cache_key(self, method, url, kwargs):
+        return gbm.cache.make_key(
+            method, url, kwargs.get('params'), kwargs.get('json'),
+            getattr(self.session, 'user', None)
+        )
+
+    def _conditional_headers(self, method, url, kwargs, conditional):
+        if not conditional:
+            return None
+        key = self._cache_key(method, url, kwargs)
+        kwargs['headers'].update(self.validators.headers(key))
+        return key
+
+    def _resolve(self, rsp, validator_key, output):
+        if validator_key is None:
+            return self._decode(rsp, output)
+        return self.validators.resolve(validator_key, rsp, self._decode)
+
+    def _without_validators(self, kwargs):
+        headers = {
+            name: value for name, value in kwargs['headers'].items()
+            if name not in gbm.cache.CONDITIONAL_HEADERS
+        }
+        return dict(kwargs, headers=headers)
+
+    def _send(self, method, url, url_segment, kwargs, conditional=False,
+              output=gbm.decoding.JSON):
+        # only the decoded responses are validated
+        validator_key = self._conditional_headers(
+            method, url, kwargs, conditional and output == gbm.decoding.JSON
+        )
+        send_kwargs = self._send_kwargs(kwargs, output)
+
+        def send():
+            return gbm.ratelimit.throttled(
+                self._limiter(url, url_segment),
+                lambda: self.driver.request(method, url, **send_kwargs),
+                self.max_throttle_retries
+            )
+
+        rsp = send()
+        try:
+            value = self._resolve(rsp, validator_key, output)
+        except gbm.cache.NotModifiedMissing:
+            send_kwargs = self._without_validators(send_kwargs)
+            rsp = send()
+            value = self._resolve(rsp, validator_key, output)
+        return value, self._body_size(rsp, output)
+
+    def _request(self, method, url_segment, cache_ttl=None, stale_ttl=0,
+                 conditional=False, output=gbm.decoding.JSON, columns=None,
+                 **kwargs):
+        """
+        Make the request and return its response decoded as requested by
+        output, see gbm.decoding, or converted to arrays with the columns
+        schema, see gbm.columnar.
+        """
+        if output in gbm.columnar.OUTPUTS:
+            rows = self._request(
+                method, url_segment, cache_ttl, stale_ttl, conditional,
+                **kwargs
             )
+            return gbm.columnar.convert(rows, output, columns)
+        url, kwargs = self._request_args(url_segment, **kwargs)
+        if cache_ttl is None or output != gbm.decoding.JSON:
+            return self._send(
+                method, url, url_segment, kwargs, conditional, output
+            )[0]
+        return self.cache.fetch(
+            self._cache_key(method, url, kwargs),
+            lambda: self._send(method, url, url_segment, kwargs, conditional),
+            cache_ttl, stale_ttl
+        )
 
     def _get(self, url_segment, **kwargs):
         return self._request("GET", url_segment, **kwargs)
@@ -46,3 +163,65 @@ class AbstractAPI:
 
     def _options(self, url_segment, **kwargs):
         return self._request("OPTIONS", url_segment, **kwargs)
+
+
+class AsyncAbstractAPI(AbstractAPI):
+    """
+    Asyncio counterpart of AbstractAPI.
+
+    The driver must be an async transport (gbm.transport.AsyncHTTPTransport),
+    the endpoint methods of the subclasses are shared with the blocking
+    APIs and return an awaitable instead of the decoded response.
+    """
+    _fan_out = staticmethod(async_fan_out)
+
+    def _decode(self, rsp, output=gbm.decoding.JSON):
+        if output == gbm.decoding.STREAM and rsp.status_code < 400:
+            return gbm.decoding.astream_rows(rsp)
+        return super()._decode(rsp, output)
+
+    async def _send(self, method, url, url_segment, kwargs,
+                    conditional=False, output=gbm.decoding.JSON):
+        validator_key = self._conditional_headers(
+            method, url, kwargs, conditional and output == gbm.decoding.JSON
+        )
+        send_kwargs = self._send_kwargs(kwargs, output)
+
+        def send():
+            return gbm.ratelimit.async_throttled(
+                self._limiter(url, url_segment),
+                lambda: self.driver.request(method, url, **send_kwargs),
+                self.max_throttle_retries
+            )
+
+        rsp = await send()
+        if output == gbm.decoding.STREAM and rsp.status_code >= 400:
+            # read the body of the error
+            await rsp.aread()
+        try:
+            value = self._resolve(rsp, validator_key, output)
+        except gbm.cache.NotModifiedMissing:
+            send_kwargs = self._without_validators(send_kwargs)
+            rsp = await send()
+            value = self._resolve(rsp, validator_key, output)
+        return value, self._body_size(rsp, output)
+
+    async def _request(self, method, url_segment, cache_ttl=None,
+                       stale_ttl=0, conditional=False,
+                       output=gbm.decoding.JSON, columns=None, **kwargs):
+        if output in gbm.columnar.OUTPUTS:
+            rows = await self._request(
+                method, url_segment, cache_ttl, stale_ttl, conditional,
+                **kwargs
+            )
+            return gbm.columnar.convert(rows, output, columns)
+        url, kwargs = self._request_args(url_segment, **kwargs)
+        if cache_ttl is None or output != gbm.decoding.JSON:
+            return (await self._send(
+                method, url, url_segment, kwargs, conditional, output
+            ))[0]
+        return await self.cache.async_fetch(
+            self._cache_key(method, url, kwargs),
+            lambda: self._send(method, url, url_segment, kwargs, conditional),
+            cache_ttl, stale_ttl
+        )
@@ -1,5 +1,9 @@
-from gbm.api._abstract import AbstractAPI
+from gbm.api._abstract import AbstractAPI, AsyncAbstractAPI
 
 
 class GBMPro(AbstractAPI):
     ...
+
+
+class AsyncGBMPro(AsyncAbstractAPI, GBMPro):
+    ...
@@ -1,6 +1,6 @@
 import gbm.urls
 
-from gbm.api._abstract import AbstractAPI
+from gbm.api._abstract import AbstractAPI, AsyncAbstractAPI
 
 
 class GBMAPIv1(AbstractAPI):
@@ -9,4 +9,8 @@ class GBMAPIv1(AbstractAPI):
         return gbm.urls.api_v1_url(*args, **kwargs)
 
     def contracts(self):
-        return self._get('/contracts')
+        return self._get('/contracts', cache_ttl=300, stale_ttl=3600)
+
+
+class AsyncGBMAPIv1(AsyncAbstractAPI, GBMAPIv1):
+    ...
@@ -1,22 +1,71 @@
-from gbm.api._abstract import AbstractAPI
+import gbm.urls
+
+from gbm.api._abstract import AbstractAPI, AsyncAbstractAPI
 
 
 class GBMAPIv2(AbstractAPI):
 
+    def _url_builder(self, *args, **kwargs):
+        return gbm.urls.api_v2_url(*args, **kwargs)
+
     def accounts(self, contract_id):
-        return self._get("/contracts/{}/accounts".format(contract_id))
+        return self._get(
+            "/contracts/{}/accounts".format(contract_id),
+            cache_ttl=60, stale_ttl=300
+        )
 
     def opening_status(self):
-        return self._get("/opening-status")
+        return self._get("/opening-status", cache_ttl=30, stale_ttl=30)
 
-    def intraday_trade_aggregates(self, exchange, security, timespan):
+    def intraday_trade_aggregates(self, exchange, security, timespan,
+                                  output='json'):
+        """
+        With output='columns' or 'array' return the NumPy arrays of every
+        key of the aggregates, see gbm.columnar.
+        """
         url = "/markets/{}/securities/{}/intraday-trade-aggregates".format(
             exchange, security
         )
-        return self._get(url, params={"timespan": timespan})
+        return self._get(
+            url, params={"timespan": timespan}, conditional=True,
+            output=output
+        )
 
-    def index_intraday(self, index):
+    def index_intraday(self, index, output='json'):
+        """
+        Same output options of intraday_trade_aggregates.
+        """
         url = "/markets/indexs/securities/{}/intraday-trades".format(
             index
         )
-        return self._get(url)
+        return self._get(url, output=output)
+
+    def bulk_intraday_trade_aggregates(self, securities, timespan,
+                                       max_workers=8):
+        """
+        Fetch the intraday trade aggregates of every (exchange, security)
+        pair of securities concurrently.
+
+        Yield a gbm.concurrency.BulkResult per pair as soon as it is
+        ready, a failed pair has its exception on the error field. On the
+        async API this is an async generator.
+
+        The requests only run concurrently with a driver that supports
+        it, i.e. the 'http' or 'pool' transports, the single driver of the
+        'driver' transport makes them one at a time.
+        """
+        return self._fan_out(
+            lambda pair: self.intraday_trade_aggregates(*pair, timespan),
+            securities, max_workers
+        )
+
+    def bulk_index_intraday(self, indices, max_workers=8):
+        """
+        Same as bulk_intraday_trade_aggregates but for index_intraday,
+        the key of each result is the index.
+        """
+        return self._fan_out(self.index_intraday, indices, max_workers)
+
+
+class AsyncGBMAPIv2(AsyncAbstractAPI, GBMAPIv2):
+    ...
@@ -1,15 +1,20 @@
+import asyncio
 import os
 import time
 import functools
 import getpass
 import json
+import logging
+import threading
 
 import gbm.urls
-from gbm.api._abstract import AbstractAPI
+from gbm.api._abstract import AbstractAPI, AsyncAbstractAPI
 from gbm.constants import HBPRO_CLIENT_ID
 from gbm.utilities import get_preferences_dir
 from gbm.base_request import get_driver
 
+logger = logging.getLogger(__name__)
+
 
 def session_file_path(user):
     return os.path.join(
@@ -19,14 +24,18 @@ def session_file_path(user):
 
 class Session:
     __slots__ = [
-        '_raw_response',
+        '_raw_response', '_auth_access_header',
         'user', 'access_token', 'identity_token', 'refresh_token',
         'token_type', 'expires_in', 'start_time'
     ]
 
     def __init__(self, user, json_rsp, start_time=None, auto_save=False):
-        self._raw_response = dict(json_rsp)
         self.user = user
+        self._update(json_rsp, start_time)
+        if auto_save:
+            self.save()
+
+    def _update(self, json_rsp, start_time=None):
         relevant_keys = (
             ('accessToken', 'access_token'),
             ('identityToken', 'identity_token'),
@@ -34,23 +43,32 @@ class Session:
             ('tokenType', 'token_type'),
             ('expiresIn', 'expires_in')
         )
-        for camel_key, snake_key in relevant_keys:
-            setattr(self, snake_key, json_rsp[camel_key])
-
-        if self.token_type != "Bearer":
+        if json_rsp['tokenType'] != "Bearer":
             raise Exception(
-                "Unsupported token type: {}".format(self.token_type)
+                "Unsupported token type: {}".format(json_rsp['tokenType'])
             )
+        self._raw_response = dict(json_rsp)
+        for camel_key, snake_key in relevant_keys:
+            setattr(self, snake_key, json_rsp[camel_key])
         if start_time is None:
             self.start_time = time.time()
         else:
             self.start_time = start_time
-        if auto_save:
-            self.save()
+        # a single assignment, the requests see the old or the new header
+        self._auth_access_header = "{} {}".format(
+            self.token_type, self.access_token
+        )
+
+    def renew(self, json_rsp):
+        """
+        Replace the tokens with the ones of json_rsp (the response of
+        AuthAPIv1.token), keeping the ones it doesn't include.
+        """
+        self._update(dict(self._raw_response, **json_rsp))
 
     @property
     def auth_access_header(self):
-        return "{} {}".format(self.token_type, self.access_token)
+        return self._auth_access_header
 
     @property
     def auth_refresh_header(self):
@@ -145,7 +163,15 @@ class AuthAPIv1(AbstractAPI):
         return self._post("/session/user/challenge", json_payload=payload)
 
     @requires_session
-    def token(self):
+    def token(self, refresh=False):
+        """
+        With refresh=True authorize with the refresh token of the session,
+        to get a new access token, see SessionRefresher.
+        """
+        if refresh:
+            return self._get("/token", headers={
+                'Authorization': self.session.auth_refresh_header
+            })
         return self._get("/token")
 
     @requires_session
@@ -153,6 +179,125 @@ class AuthAPIv1(AbstractAPI):
         return self._get('/security-settings')
 
 
+class AsyncAuthAPIv1(AsyncAbstractAPI, AuthAPIv1):
+    ...
+
+
+class SessionRefresher:
+    """
+    Renew the access token of the session of auth_api (an AuthAPIv1) with
+    its refresh token, on a background thread, when fraction of its
+    lifetime has passed, and save it with Session.save if save is True.
+
+    The requests keep using the current token until the new one is
+    swapped in, so they never wait for the renewal. A failed renewal is
+    logged and tried again every retry_interval seconds.
+
+        refresher = SessionRefresher(apis.auth)
+        refresher.start()
+    """
+
+    def __init__(self, auth_api, fraction=0.75, retry_interval=30,
+                 save=True):
+        self.auth_api = auth_api
+        self.fraction = fraction
+        self.retry_interval = retry_interval
+        self.save = save
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def session(self):
+        return self.auth_api.session
+
+    def next_refresh(self):
+        """
+        Seconds until the next renewal is due.
+        """
+        session = self.session
+        due = session.start_time + session.expires_in * self.fraction
+        return max(due - time.time(), 0)
+
+    def _renewed(self, json_rsp):
+        self.session.renew(json_rsp)
+        if self.save:
+            self.session.save()
+        logger.info("Renewed the session of %s, it expires in %s seconds",
+                    self.session.user, self.session.expires_in)
+
+    def refresh(self):
+        """
+        Renew the access token now.
+        """
+        self._renewed(self.auth_api.token(refresh=True))
+
+    def _run(self):
+        wait = self.next_refresh()
+        while not self._stopped.wait(wait):
+            try:
+                self.refresh()
+            except Exception as error:
+                logger.warning("Unable to renew the session of %s: %s",
+                               self.session.user, error)
+                wait = self.retry_interval
+            else:
+                wait = self.next_refresh()
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name='gbm-session-refresher', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class AsyncSessionRefresher(SessionRefresher):
+    """
+    Asyncio version of SessionRefresher, auth_api is an AsyncAuthAPIv1 and
+    the renewal runs on a task of the running loop.
+    """
+
+    def __init__(self, auth_api, fraction=0.75, retry_interval=30,
+                 save=True):
+        super().__init__(auth_api, fraction, retry_interval, save)
+        self._task = None
+
+    async def refresh(self):
+        json_rsp = await self.auth_api.token(refresh=True)
+        await asyncio.to_thread(self._renewed, json_rsp)
+
+    async def _run(self):
+        wait = self.next_refresh()
+        while True:
+            await asyncio.sleep(wait)
+            try:
+                await self.refresh()
+            except Exception as error:
+                logger.warning("Unable to renew the session of %s: %s",
+                               self.session.user, error)
+                wait = self.retry_interval
+            else:
+                wait = self.next_refresh()
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
 def login(user, password=None, driver=None):
     if driver is None:
         driver = get_driver()
@@ -176,3 +321,26 @@ def logout(session, driver=None):
         driver = get_driver()
     auth_api = AuthAPIv1(driver)
     return auth_api.delete_session_user(session.auth_refresh_header)
+
+
+async def async_login(user, password, driver):
+    """
+    Asyncio version of login, the driver must be an async transport.
+    """
+    if password is None:
+        password = await asyncio.to_thread(getpass.getpass, "GBM Password: ")
+    auth_api = AsyncAuthAPIv1(driver)
+    rsp = await auth_api.session_user(user, password)
+    cinfo = rsp["challengeInfo"]
+    if cinfo["challengeType"] != "SOFTWARE_TOKEN_MFA":
+        raise Exception("Unable to determine what to do")
+    two_factor_token = await asyncio.to_thread(input, "Token: ")
+    credentials = await auth_api.session_user_challenge(
+        user, cinfo['session'], two_factor_token
+    )
+    return Session(user, credentials)
+
+
+async def async_logout(session, driver):
+    auth_api = AsyncAuthAPIv1(driver)
+    return await auth_api.delete_session_user(session.auth_refresh_header)
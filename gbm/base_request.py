@@ -1,16 +1,36 @@
+import atexit
+import concurrent.futures
+import contextlib
 import functools
+import logging
 import os
+import queue
 import tempfile
-import atexit
-
-import seleniumrequests
-import selenium.webdriver
+import threading
 
 import gbm.urls
+from gbm.utilities import Timings, startup_timings
 
+logger = logging.getLogger(__name__)
 
-@functools.cache
-def get_driver():
+
+def new_driver(warm_up=True, timings=None):
+    """
+    Start a new headless firefox driver, if warm_up is True load the
+    sign in form to get the anti-bot cookies.
+
+    If timings is given, record the time it took to start and warm up
+    the driver on it.
+
+    The caller is responsible of calling quit on the driver.
+    """
+    # selenium takes a good part of a second just to be imported,
+    # only pay for it when a driver is really needed
+    import seleniumrequests
+    import selenium.webdriver
+
+    if timings is None:
+        timings = Timings()
     options = selenium.webdriver.firefox.options.Options()
     options.add_argument("--headless")
     driver_args = {
@@ -34,8 +54,173 @@ def get_driver():
     #         "sslProxy": proxy_host,
     #     }
     #     driver_args["capabilities"] = caps
-    driver = seleniumrequests.Firefox(**driver_args)
+    with timings.measure('driver_start'):
+        driver = seleniumrequests.Firefox(**driver_args)
+    if warm_up:
+        # get the page to get the incapsula cookie
+        with timings.measure('warm_up'):
+            driver.get(gbm.urls.SIGNIN_FORM_URL)
+    return driver
+
+
+@functools.cache
+def get_driver():
+    driver = new_driver(timings=startup_timings)
     atexit.register(driver.quit)
-    # get the page to get the incapsula cookie
-    driver.get(gbm.urls.SIGNIN_FORM_URL)
     return driver
+
+
+class LazyDriver:
+    """
+    Proxy of the driver returned by factory, the driver is only created
+    on the first request or attribute access.
+
+    Calling the instance returns the real driver, so it can also be used
+    as the driver_factory of the transports.
+
+    A single driver can't make concurrent requests, the requests made
+    through the proxy from several threads are serialized.
+    """
+
+    def __init__(self, factory=get_driver):
+        self._factory = factory
+        self._driver = None
+        self._lock = threading.Lock()
+        self._request_lock = threading.Lock()
+
+    def __call__(self):
+        if self._driver is None:
+            with self._lock:
+                if self._driver is None:
+                    self._driver = self._factory()
+        return self._driver
+
+    @property
+    def started(self):
+        return self._driver is not None
+
+    def request(self, method, url, **kwargs):
+        driver = self()
+        with self._request_lock:
+            return driver.request(method, url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self(), name)
+
+
+def is_alive(driver):
+    """
+    Return True if the driver (and its geckodriver process) still responds.
+    """
+    import selenium.common.exceptions
+
+    try:
+        driver.current_url
+    except selenium.common.exceptions.WebDriverException:
+        return False
+    return True
+
+
+class DriverPool:
+    """
+    Thread-safe pool of selenium drivers.
+
+    The drivers are started and warmed up in parallel on the first
+    checkout, every checked out driver is health-checked and replaced
+    with a new one if its geckodriver process crashed.
+
+    The pool can be used in place of a single driver on the API classes,
+    each request checks out a driver for the duration of the call.
+    """
+
+    def __init__(self, size=2, factory=new_driver):
+        self.size = size
+        self._factory = factory
+        self._idle = queue.Queue()
+        # every driver started, idle or checked out
+        self._drivers = set()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._closed = False
+
+    def _new_driver(self):
+        driver = self._factory()
+        with self._lock:
+            self._drivers.add(driver)
+        return driver
+
+    def _quit(self, driver):
+        with self._lock:
+            if driver not in self._drivers:
+                return  # already quit by close
+            self._drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            logger.exception("Unable to quit the driver")
+
+    def start(self):
+        with self._start_lock:
+            if self._started:
+                return
+            with concurrent.futures.ThreadPoolExecutor(self.size) as pool:
+                for driver in pool.map(
+                        lambda _: self._new_driver(), range(self.size)):
+                    self._idle.put(driver)
+            self._started = True
+            atexit.register(self.close)
+
+    def _recycle(self, driver):
+        logger.warning("Replacing unresponsive driver %r", driver)
+        self._quit(driver)
+        return self._new_driver()
+
+    def checkout(self, timeout=None):
+        if self._closed:
+            raise RuntimeError("The driver pool is closed")
+        self.start()
+        driver = self._idle.get(timeout=timeout)
+        if not is_alive(driver):
+            try:
+                driver = self._recycle(driver)
+            except Exception:
+                # give the slot back to not shrink the pool
+                self._idle.put(driver)
+                raise
+        return driver
+
+    def checkin(self, driver):
+        if self._closed:
+            # nobody would quit it
+            self._quit(driver)
+        else:
+            self._idle.put(driver)
+
+    @contextlib.contextmanager
+    def driver(self, timeout=None):
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        finally:
+            self.checkin(driver)
+
+    def request(self, method, url, **kwargs):
+        with self.driver() as driver:
+            return driver.request(method, url, **kwargs)
+
+    def close(self):
+        """
+        Quit every driver of the pool, also the ones checked out, those
+        fail on their next request.
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+        with self._lock:
+            drivers = list(self._drivers)
+        for driver in drivers:
+            self._quit(driver)
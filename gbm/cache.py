@@ -0,0 +1,431 @@
+import asyncio
+import collections
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from gbm.exceptions import GBMException
+from gbm.utilities import get_preferences_dir
+
+logger = logging.getLogger(__name__)
+
+_Entry = collections.namedtuple(
+    '_Entry', ['value', 'size', 'fresh_until', 'stale_until']
+)
+
+
+def make_key(*parts):
+    """
+    Return a stable string key for the parts of a request, e.g. the
+    method, url, params, body and the user.
+    """
+    return json.dumps(parts, sort_keys=True, default=str)
+
+
+class _BaseCache:
+    """
+    The fetch logic shared by the caches, the subclasses implement:
+
+      get(key) -> (value, is_fresh) or None on a miss
+      set(key, value, size, ttl, stale_ttl)
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self._refreshing = set()
+        # keep a reference to the async refreshes while they run
+        self._tasks = set()
+        self._refresh_lock = threading.Lock()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+        }
+
+    def _start_refresh(self, key):
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def _refresh(self, key, fetch, ttl, stale_ttl):
+        try:
+            value, size = fetch()
+            self.set(key, value, size, ttl, stale_ttl)
+        except Exception:
+            logger.exception("Unable to refresh the cached %s", key)
+        finally:
+            self._refreshing.discard(key)
+
+    def fetch(self, key, fetch, ttl, stale_ttl=0):
+        """
+        Return the cached value of key, calling fetch on a miss.
+
+        fetch must return a (value, size) tuple, the size is the length of
+        the response body and it's used to bound the size of the cache,
+        fetch must raise instead of returning an error response.
+
+        The cached values are shared between callers, they must not be
+        mutated.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            value, is_fresh = cached
+            if not is_fresh and self._start_refresh(key):
+                threading.Thread(
+                    target=self._refresh,
+                    args=(key, fetch, ttl, stale_ttl),
+                    daemon=True
+                ).start()
+            return value
+        value, size = fetch()
+        self.set(key, value, size, ttl, stale_ttl)
+        return value
+
+    async def _async_refresh(self, key, fetch, ttl, stale_ttl):
+        try:
+            value, size = await fetch()
+            self.set(key, value, size, ttl, stale_ttl)
+        except Exception:
+            logger.exception("Unable to refresh the cached %s", key)
+        finally:
+            self._refreshing.discard(key)
+
+    async def async_fetch(self, key, fetch, ttl, stale_ttl=0):
+        """
+        Asyncio version of fetch, fetch must return an awaitable.
+        """
+        cached = self.get(key)
+        if cached is not None:
+            value, is_fresh = cached
+            if not is_fresh and self._start_refresh(key):
+                task = asyncio.ensure_future(
+                    self._async_refresh(key, fetch, ttl, stale_ttl)
+                )
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+        value, size = await fetch()
+        self.set(key, value, size, ttl, stale_ttl)
+        return value
+
+
+class ResponseCache(_BaseCache):
+    """
+    In-memory cache of decoded responses with a TTL per entry, bounded
+    in number of entries and total size of the response bodies, the least
+    recently used entries are evicted first.
+
+    An entry older than its ttl but younger than ttl + stale_ttl is still
+    served while it is refreshed in the background (stale-while-revalidate).
+
+    The values are stored as they are, every hit returns the same object,
+    not a copy.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024):
+        super().__init__()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is None or now >= entry.stale_until:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if now < entry.fresh_until:
+                self.hits += 1
+                return entry.value, True
+            self.stale_hits += 1
+            return entry.value, False
+
+    def set(self, key, value, size, ttl, stale_ttl=0):
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(
+                value, size, now + ttl, now + ttl + stale_ttl
+            )
+            self._bytes += size
+            while (len(self._entries) > self.max_entries or
+                   self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+class SQLiteCache(_BaseCache):
+    """
+    On-disk cache of decoded responses shared by several processes,
+    stored in a WAL mode SQLite database, by default in the preferences
+    dir.
+
+    When the total size of the bodies goes over max_bytes the entries
+    closest to expire are evicted first.
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 1024 * 1024):
+        super().__init__()
+        if path is None:
+            path = os.path.join(get_preferences_dir(), 'response_cache.db')
+        self.path = path
+        self.max_bytes = max_bytes
+        # sqlite connections can't be shared between threads
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " fresh_until REAL NOT NULL,"
+                " stale_until REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS responses_stale_until"
+                " ON responses (stale_until)"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        row = self._connection().execute(
+            "SELECT value, fresh_until, stale_until FROM responses"
+            " WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now >= row[2]:
+            self.misses += 1
+            return None
+        value = json.loads(row[0])
+        if now < row[1]:
+            self.hits += 1
+            return value, True
+        self.stale_hits += 1
+        return value, False
+
+    def expiration(self, key):
+        """
+        Return the (fresh_until, stale_until) unix times of the key and
+        the size of its body.
+        """
+        return self._connection().execute(
+            "SELECT fresh_until, stale_until, size FROM responses"
+            " WHERE key = ?", (key,)
+        ).fetchone()
+
+    def set(self, key, value, size, ttl, stale_ttl=0):
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value), size,
+                 now + ttl, now + ttl + stale_ttl)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM responses WHERE stale_until <= ?", (now,))
+        total, = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM responses ORDER BY stale_until"
+        )
+        evict = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute("DELETE FROM responses")
+
+
+class TieredCache(_BaseCache):
+    """
+    In-memory cache in front of an optional on-disk cache, the entries
+    found on disk are promoted to memory for the rest of their TTL.
+    """
+
+    def __init__(self, memory, disk=None):
+        super().__init__()
+        self.memory = memory
+        self.disk = disk
+
+    def stats(self):
+        stats = {'memory': self.memory.stats()}
+        if self.disk is not None:
+            stats['disk'] = self.disk.stats()
+        return stats
+
+    def get(self, key):
+        cached = self.memory.get(key)
+        if cached is not None or self.disk is None:
+            return cached
+        cached = self.disk.get(key)
+        if cached is not None:
+            expiration = self.disk.expiration(key)
+            if expiration is not None:
+                now = time.time()
+                fresh_until, stale_until, size = expiration
+                ttl = max(0.0, fresh_until - now)
+                self.memory.set(
+                    key, cached[0], size, ttl, stale_until - now - ttl
+                )
+        return cached
+
+    def set(self, key, value, size, ttl, stale_ttl=0):
+        self.memory.set(key, value, size, ttl, stale_ttl)
+        if self.disk is not None:
+            self.disk.set(key, value, size, ttl, stale_ttl)
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+
+# the headers of the validators, see ValidatorStore.headers
+CONDITIONAL_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+
+class NotModifiedMissing(GBMException):
+    """
+    A 304 response to a request whose stored value is gone, e.g. evicted
+    while the request was made, it must be sent again without validators.
+    """
+
+
+_Validated = collections.namedtuple(
+    '_Validated', ['etag', 'last_modified', 'digest', 'value']
+)
+
+
+class ValidatorStore:
+    """
+    Validators (ETag, Last-Modified) and decoded value of the last
+    response of each request, used to make conditional requests.
+
+    A 304 response returns the stored value, and so does a full response
+    whose body hash is the same as the last one, so the servers without
+    validators still skip the decoding of an unchanged body.
+
+    The stored values are shared between callers, they must not be
+    mutated.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.not_modified = 0
+        self.unchanged = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def headers(self, key):
+        """
+        Return the conditional headers for the request of key.
+        """
+        entry = self._entries.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def resolve(self, key, rsp, decode):
+        """
+        Return the decoded value of the response, calling decode(rsp) only
+        if it's not the same as the last response of key.
+
+        Raise NotModifiedMissing on a 304 response without a stored value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if rsp.status_code == 304:
+            if entry is None:
+                raise NotModifiedMissing(key)
+            self.not_modified += 1
+            return entry.value
+        digest = hashlib.blake2b(rsp.content, digest_size=16).digest()
+        if entry is not None and entry.digest == digest:
+            self.unchanged += 1
+            return entry.value
+        value = decode(rsp)
+        with self._lock:
+            self._entries[key] = _Validated(
+                rsp.headers.get('ETag'),
+                rsp.headers.get('Last-Modified'),
+                digest,
+                value
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+
+# cache shared by all the APIs
+default_cache = TieredCache(ResponseCache())
+default_validators = ValidatorStore()
+
+
+def enable_disk_cache(path=None, max_bytes=256 * 1024 * 1024):
+    """
+    Put a SQLiteCache behind the in-memory cache of all the APIs, so the
+    responses fetched by a process are served to the others.
+    """
+    default_cache.disk = SQLiteCache(path, max_bytes)
+    return default_cache.disk
+
+
+if os.environ.get('GBM_DISK_CACHE'):
+    enable_disk_cache()
@@ -0,0 +1,170 @@
+"""
+Columnar output of the price and bar series.
+
+The endpoints of the series take output='columns' to get a dict of NumPy
+arrays, one per column, or output='array' to get a structured array. The
+columns are built from the rows of the decoded JSON, one pass per column,
+after the regular request, so the rows are still cached and validated as
+any other response, see gbm.cache.
+
+Missing values, either a missing key or a null, are NaN on the numeric
+columns and NaT on the time columns, see `missing`. The times are in UTC,
+see gbm.timestamps.
+"""
+import collections
+import operator
+
+# numpy is imported on the first conversion, not with gbm, see
+# _require_numpy
+np = None
+
+import gbm.timestamps
+from gbm.exceptions import GBMException
+
+# a dict of column name -> array
+COLUMNS = 'columns'
+# a structured array with a field per column
+ARRAY = 'array'
+
+OUTPUTS = (COLUMNS, ARRAY)
+
+# the kinds of columns
+TIME = 'time'
+FLOAT = 'float'
+OBJECT = 'object'
+
+Column = collections.namedtuple('Column', 'name key kind')
+
+# daily bars of capital_market_historic_price and the minute bars of
+# instrument_prices_intraday_complete
+BARS = (
+    Column('date', 'date', TIME),
+    Column('open', 'openPrice', FLOAT),
+    Column('high', 'maxPrice', FLOAT),
+    Column('low', 'minPrice', FLOAT),
+    Column('close', 'closePrice', FLOAT),
+    Column('change', 'percentageChange', FLOAT),
+    Column('volume', 'volume', FLOAT),
+)
+
+# instrument_prices_intraday_ppp and index_intraday
+PRICES = (
+    Column('date', 'date', TIME),
+    Column('price', 'price', FLOAT),
+    Column('change', 'percentageChange', FLOAT),
+    Column('volume', 'volume', FLOAT),
+)
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise GBMException(
+                "The columnar output requires numpy, "
+                "install the 'numpy' extra."
+            ) from None
+        np = numpy
+
+
+def kind_dtype(kind):
+    """
+    The NumPy dtype of the columns of kind.
+    """
+    _require_numpy()
+    return {
+        TIME: 'datetime64[ns]',
+        FLOAT: np.float64,
+        OBJECT: object,
+    }[kind]
+
+
+def _infer_kind(value):
+    if isinstance(value, bool):
+        return OBJECT
+    if isinstance(value, (int, float)):
+        return FLOAT
+    if isinstance(value, str) and gbm.timestamps.is_timestamp(value):
+        return TIME
+    return OBJECT
+
+
+def infer_schema(rows):
+    """
+    Schema of the keys of rows, in order of appearance, with the kind of
+    the first value that is not null.
+    """
+    kinds = {}
+    for row in rows:
+        for key, value in row.items():
+            if kinds.get(key) is None:
+                kinds[key] = None if value is None else _infer_kind(value)
+    return tuple(
+        Column(key, key, OBJECT if kind is None else kind)
+        for key, kind in kinds.items()
+    )
+
+
+def _column(rows, column):
+    values = list(map(operator.methodcaller('get', column.key), rows))
+    if column.kind == TIME:
+        return gbm.timestamps.parse_times(values)
+    if column.kind == OBJECT:
+        # np.array would make a 2D array of the lists of the same length
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
+    # None is converted to NaN by numpy on the float columns
+    return np.array(values, dtype=kind_dtype(column.kind))
+
+
+def to_columns(rows, schema=None):
+    """
+    Dict of the arrays of each column of schema (a sequence of Column)
+    from the list of dicts rows. Without schema all the keys of the rows
+    are converted, see infer_schema.
+    """
+    _require_numpy()
+    if schema is None:
+        schema = infer_schema(rows)
+    return {column.name: _column(rows, column) for column in schema}
+
+
+def to_array(rows, schema=None):
+    """
+    Same as to_columns but as a structured array.
+    """
+    _require_numpy()
+    if schema is None:
+        schema = infer_schema(rows)
+    array = np.empty(len(rows), dtype=[
+        (column.name, kind_dtype(column.kind)) for column in schema
+    ])
+    for column in schema:
+        array[column.name] = _column(rows, column)
+    return array
+
+
+def convert(rows, output, schema=None):
+    """
+    Convert rows to the columnar output, COLUMNS or ARRAY.
+    """
+    if output == COLUMNS:
+        return to_columns(rows, schema)
+    elif output == ARRAY:
+        return to_array(rows, schema)
+    raise ValueError("Unknown columnar output {!r}".format(output))
+
+
+def missing(column):
+    """
+    Mask of the missing values of a column array.
+    """
+    _require_numpy()
+    if column.dtype.kind == 'M':
+        return np.isnat(column)
+    if column.dtype.kind == 'f':
+        return np.isnan(column)
+    return np.equal(column, None)
@@ -0,0 +1,116 @@
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import threading
+
+
+# result of a single item of a bulk call, either value or error is set
+BulkResult = collections.namedtuple('BulkResult', ['key', 'value', 'error'])
+
+
+def fan_out(func, keys, max_workers=8):
+    """
+    Call func(key) for every key with at most max_workers threads and
+    yield a BulkResult for each one as soon as it finishes.
+
+    An exception on one of the calls is reported on its BulkResult and
+    does not stop the rest of the batch.
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+    try:
+        futures = {pool.submit(func, key): key for key in keys}
+        for future in concurrent.futures.as_completed(futures):
+            key = futures[future]
+            try:
+                yield BulkResult(key, future.result(), None)
+            except Exception as error:
+                yield BulkResult(key, None, error)
+    finally:
+        # the consumer may stop early, don't wait for the pending keys
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def prefetched(func, keys, ahead=4):
+    """
+    Yield func(key) for every key, in the order of keys, while the calls
+    of the next ahead keys run on threads, keys may be endless, e.g. the
+    indices of the pages of a paginated endpoint.
+
+    An exception of a call is raised when its value is reached, the calls
+    still pending when the consumer stops are cancelled.
+    """
+    keys = iter(keys)
+    pool = concurrent.futures.ThreadPoolExecutor(ahead)
+    pending = collections.deque()
+    try:
+        for key in itertools.islice(keys, ahead):
+            pending.append(pool.submit(func, key))
+        while pending:
+            value = pending.popleft().result()
+            for key in itertools.islice(keys, 1):
+                pending.append(pool.submit(func, key))
+            yield value
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def async_fan_out(func, keys, max_workers=8):
+    """
+    Asyncio version of fan_out, func(key) must return an awaitable and
+    at most max_workers of them are awaited at the same time.
+    """
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(key):
+        async with semaphore:
+            try:
+                return BulkResult(key, await func(key), None)
+            except Exception as error:
+                return BulkResult(key, None, error)
+
+    tasks = [asyncio.ensure_future(run(key)) for key in keys]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class AdaptiveSize:
+    """
+    Size of the batches of some work, e.g. the days of the chunks of a
+    date range, adjusted after every batch so each one takes about target
+    seconds, between minimum and maximum.
+
+    It can be shared by the threads that make the batches.
+    """
+
+    def __init__(self, initial, minimum, maximum, target=2.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self._size = initial
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return max(self.minimum, int(self._size))
+
+    def observe(self, size, seconds):
+        """
+        Record that a batch of size took seconds.
+        """
+        with self._lock:
+            wanted = size * self.target / max(seconds, 1e-3)
+            # move at most to the half or the double on every batch
+            wanted = min(max(wanted, self._size / 2), self._size * 2)
+            self._size = min(max(wanted, self.minimum), self.maximum)
+
+    def failed(self):
+        """
+        Record that a batch failed, e.g. with a timeout, halving the size.
+        """
+        with self._lock:
+            self._size = max(self._size / 2, self.minimum)
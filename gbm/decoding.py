@@ -0,0 +1,211 @@
+import codecs
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# The JSON backend is picked from the installed libraries, in order:
+# orjson, msgspec and the standard library json, it can be forced with
+# the GBM_JSON_BACKEND environment variable or set_backend. All of them
+# decode the raw bytes of the body, without decoding it to text first.
+
+
+def _orjson_loads():
+    import orjson
+    return orjson.loads
+
+
+def _msgspec_loads():
+    import msgspec
+    return msgspec.json.Decoder().decode
+
+
+def _stdlib_loads():
+    # json.loads detects the encoding of bytes by itself
+    return json.loads
+
+
+BACKENDS = {
+    'orjson': _orjson_loads,
+    'msgspec': _msgspec_loads,
+    'json': _stdlib_loads,
+}
+
+# the decoded JSON, the default
+JSON = 'json'
+# the body as is, for the callers that parse it by themselves
+BYTES = 'bytes'
+# a generator of the items of a JSON array, parsed while it's downloaded
+STREAM = 'stream'
+
+OUTPUTS = (JSON, BYTES, STREAM)
+
+# size of the chunks read from the streamed responses
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = ' \t\n\r'
+# the characters that can follow a complete item of an array
+_DELIMITERS = _WHITESPACE + ',]'
+
+backend = None
+loads = None
+
+
+def set_backend(name=None):
+    """
+    Use the JSON backend name, or the fastest one installed if None.
+    """
+    global backend, loads
+    names = list(BACKENDS) if name is None else [name]
+    for candidate in names:
+        try:
+            loads = BACKENDS[candidate]()
+        except ImportError:
+            if name is not None:
+                raise
+            continue
+        backend = candidate
+        logger.debug("Using the %s JSON backend", backend)
+        return backend
+
+
+def decode_body(content, output=JSON):
+    """
+    Decode the body of a response as requested by output, except STREAM
+    that needs the response itself, see stream_rows.
+    """
+    if output == JSON:
+        return loads(content)
+    elif output == BYTES:
+        return content
+    else:
+        raise ValueError("Unknown output: {}".format(output))
+
+
+class ArrayParser:
+    """
+    Incremental parser of a top level JSON array.
+
+    feed takes the chunks of the body as they arrive and returns the items
+    completed so far, only the incomplete item is kept in memory. Anything
+    but whitespace after the closing bracket is an error, as it is for
+    json.loads.
+    """
+
+    def __init__(self):
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ''
+        # one of: start, item, separator or end
+        self._state = 'start'
+
+    def _skip_whitespace(self, pos):
+        while pos < len(self._buffer) and self._buffer[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def feed(self, chunk, final=False):
+        self._buffer += self._text.decode(chunk, final)
+        items = []
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = self._skip_whitespace(pos)
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+            if self._state == 'end':
+                raise ValueError(
+                    "Extra data after the JSON array: {!r}".format(char)
+                )
+            if self._state == 'start':
+                if char != '[':
+                    raise ValueError("The body is not a JSON array")
+                pos += 1
+                self._state = 'first'
+            elif self._state in ('first', 'item'):
+                if char == ']':
+                    if self._state == 'item':
+                        raise ValueError("Trailing comma in the JSON array")
+                    pos += 1
+                    self._state = 'end'
+                    continue
+                try:
+                    item, end = self._decoder.raw_decode(buffer, pos)
+                except ValueError:
+                    if final:
+                        raise
+                    break  # incomplete item, wait for more data
+                if not final and (end == len(buffer) or
+                                  buffer[end] not in _DELIMITERS):
+                    break  # e.g. a number that continues on the next chunk
+                items.append(item)
+                pos = end
+                self._state = 'separator'
+            elif self._state == 'separator':
+                if char == ',':
+                    self._state = 'item'
+                elif char == ']':
+                    self._state = 'end'
+                else:
+                    raise ValueError(
+                        "Unexpected {!r} in the JSON array".format(char)
+                    )
+                pos += 1
+        self._buffer = buffer[pos:]
+        if final and self._state != 'end':
+            raise ValueError("Incomplete JSON array")
+        return items
+
+
+def iter_json_array(chunks):
+    """
+    Yield the items of the JSON array from an iterable of byte chunks.
+    """
+    parser = ArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    yield from parser.feed(b'', final=True)
+
+
+async def aiter_json_array(chunks):
+    """
+    Same as iter_json_array, from an async iterable of byte chunks.
+    """
+    parser = ArrayParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    for item in parser.feed(b'', final=True):
+        yield item
+
+
+def stream_rows(rsp, chunk_size=CHUNK_SIZE):
+    """
+    Yield the items of the JSON array of a requests response made with
+    stream=True, closing it at the end.
+    """
+    try:
+        yield from iter_json_array(rsp.iter_content(chunk_size))
+    finally:
+        rsp.close()
+
+
+async def astream_rows(rsp):
+    """
+    Same as stream_rows for an httpx response sent with stream=True.
+    """
+    if not hasattr(rsp, 'aiter_bytes'):
+        # already downloaded, e.g. by the fallback to the driver
+        for item in iter_json_array([rsp.content]):
+            yield item
+        return
+    try:
+        async for item in aiter_json_array(rsp.aiter_bytes()):
+            yield item
+    finally:
+        await rsp.aclose()
+
+
+set_backend(os.environ.get('GBM_JSON_BACKEND'))
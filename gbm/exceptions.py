@@ -2,3 +2,16 @@ class GBMException(Exception):
     """
     Base exception for the module.
     """
+
+
+class APIError(GBMException):
+    """
+    The API returned an error response.
+    """
+
+    def __init__(self, status_code, text):
+        super().__init__(
+            "API error: code: {}, text: {}".format(status_code, text)
+        )
+        self.status_code = status_code
+        self.text = text
@@ -0,0 +1,187 @@
+"""
+Incremental tracking of the intraday bars.
+
+The intraday endpoints return the whole session on every poll, the
+IntradayTracker keeps the last bars of each instrument on a
+gbm.ring.ColumnRing and only looks at the tail of every poll: the bars
+after the last one it has, plus the last revision_window bars it already
+has (at least the last one), that may still change while their period
+isn't over, e.g. the bar of the current minute. The subscribers get just
+the new and revised bars.
+
+The memory is fixed by the capacity of the rings, and the work of a poll
+(besides decoding it) by the number of bars that changed.
+"""
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import gbm.columnar
+from gbm.concurrency import fan_out
+from gbm.exceptions import GBMException
+from gbm.ring import ColumnRing
+
+logger = logging.getLogger(__name__)
+
+
+def _changed(old, new):
+    # NaN != NaN, a missing value that is still missing isn't a change
+    different = old != new
+    if new.dtype.kind in 'fM':
+        both_missing = (np.isnat(old) & np.isnat(new) if new.dtype.kind == 'M'
+                        else np.isnan(old) & np.isnan(new))
+        different &= ~both_missing
+    return different
+
+
+class IntradayTracker:
+    """
+    Track the intraday bars of many instruments.
+
+    fetch(instrument) must return the bars of the session as the dict of
+    arrays of gbm.columnar (output='columns'), sorted by time_column, e.g.
+    with IntradayTracker.from_market or, for the v2 API:
+
+        IntradayTracker(
+            lambda pair: api.intraday_trade_aggregates(
+                *pair, timespan, output='columns'
+            ),
+            time_column=<the time key of the aggregates>
+        )
+
+    The instruments are whatever fetch takes, e.g. the (exchange, security)
+    pairs above, and are used as the keys of the rings.
+    """
+
+    def __init__(self, fetch, capacity=512, revision_window=2,
+                 time_column='date'):
+        if np is None:
+            raise GBMException(
+                "The intraday tracker requires numpy, "
+                "install the 'numpy' extra."
+            )
+        self.fetch = fetch
+        self.capacity = capacity
+        self.revision_window = revision_window
+        self.time_column = time_column
+        self._rings = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_market(cls, market, request=60, **kwargs):
+        """
+        Tracker of Market.instrument_prices_intraday_complete.
+        """
+        return cls(
+            lambda instrument: market.instrument_prices_intraday_complete(
+                instrument, request, output=gbm.columnar.COLUMNS
+            ),
+            **kwargs
+        )
+
+    def subscribe(self, callback):
+        """
+        Call callback(instrument, delta) with the new and revised bars of
+        every update, delta is a dict of arrays like the ones of fetch.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def bars(self, instrument):
+        """
+        Copy of the bars kept of instrument, oldest first.
+        """
+        with self._lock:
+            ring = self._rings.get(instrument)
+            return None if ring is None else ring.columns()
+
+    def last_time(self, instrument):
+        with self._lock:
+            ring = self._rings.get(instrument)
+            if ring is None or not len(ring):
+                return None
+            return ring.last(self.time_column)
+
+    def _merge(self, ring, columns):
+        if not len(ring):
+            ring.append(columns)
+            return columns
+        # the polled bars from the first one that may be revised
+        window = max(1, min(self.revision_window, len(ring)))
+        known = ring.column(self.time_column, -window)
+        times = columns[self.time_column]
+        tail = np.searchsorted(times, known[0])
+        split = np.searchsorted(times, known[-1], side='right')
+        old = {name: column[tail:split] for name, column in columns.items()}
+        added = {name: column[split:] for name, column in columns.items()}
+
+        # compare the bars already on the ring, matched by time
+        positions = np.searchsorted(known, old[self.time_column])
+        matched = known[positions] == old[self.time_column]
+        positions = positions[matched]
+        old = {name: column[matched] for name, column in old.items()}
+        revised = np.zeros(len(positions), dtype=bool)
+        for name, column in old.items():
+            revised |= _changed(ring.column(name, -window)[positions], column)
+        revised_bars = {name: column[revised] for name, column in old.items()}
+        if revised.any():
+            ring.put(len(ring) - window + positions[revised], revised_bars)
+
+        ring.append(added)
+        return {
+            name: np.concatenate([revised_bars[name], added[name]])
+            for name in columns
+        }
+
+    def update(self, instrument, columns):
+        """
+        Merge the polled bars of instrument, return the delta (also sent
+        to the subscribers) or None if nothing changed.
+        """
+        valid = ~np.isnat(columns[self.time_column])
+        columns = {name: column[valid] for name, column in columns.items()}
+        with self._lock:
+            ring = self._rings.get(instrument)
+            if ring is None:
+                ring = self._rings[instrument] = ColumnRing.like(
+                    self.capacity, columns
+                )
+            delta = self._merge(ring, columns)
+        if not len(delta[self.time_column]):
+            return None
+        for callback in list(self._subscribers):
+            try:
+                callback(instrument, delta)
+            except Exception:
+                logger.exception("Error on the intraday subscriber %r",
+                                 callback)
+        return delta
+
+    def poll(self, instruments, max_workers=8):
+        """
+        Fetch and merge the bars of every instrument concurrently, see
+        gbm.concurrency.fan_out, the failed fetches are logged and skipped.
+
+        Return a dict instrument -> delta of the instruments that changed.
+        """
+        deltas = {}
+        for result in fan_out(self.fetch, instruments, max_workers):
+            if result.error is not None:
+                logger.warning("Unable to poll %s: %s",
+                               result.key, result.error)
+                continue
+            delta = self.update(result.key, result.value)
+            if delta is not None:
+                deltas[result.key] = delta
+        return deltas
+
+    def forget(self, instrument):
+        with self._lock:
+            self._rings.pop(instrument, None)
@@ -0,0 +1,179 @@
+"""
+Change sets of the snapshots of Market.market_price_monitor_detail.
+
+Every poll of the monitor returns the whole universe, the SnapshotDiffer
+compares it with the previous snapshot column by column (see
+gbm.columnar) and only builds Python objects for the instruments that
+changed, so the downstream work follows the activity of the market and
+not the size of the universe.
+"""
+import collections
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import gbm.columnar
+from gbm.exceptions import GBMException
+
+logger = logging.getLogger(__name__)
+
+# added: {issue_id: row}, updated: {issue_id: {key: new value}}, both
+# with the keys of the API, and removed: [issue_id, ...]
+ChangeSet = collections.namedtuple('ChangeSet', 'added updated removed')
+
+
+def _different(old, new):
+    if new.dtype.kind == 'f':
+        # NaN != NaN, a value still missing isn't a change
+        return (old != new) & ~(np.isnan(old) & np.isnan(new))
+    if new.dtype.kind == 'M':
+        return (old != new) & ~(np.isnat(old) & np.isnat(new))
+    return np.asarray(old != new, dtype=bool)
+
+
+class SnapshotDiffer:
+    """
+    Keep the last snapshot of the rows of a monitor and compute the
+    ChangeSet of the next one.
+
+    The schema of the columns is inferred from the first snapshot, the
+    keys that show up later are ignored.
+    """
+
+    def __init__(self, key='issueID'):
+        if np is None:
+            raise GBMException(
+                "The snapshot differ requires numpy, "
+                "install the 'numpy' extra."
+            )
+        self.key = key
+        self.schema = None
+        self._rows = []
+        self._keys = np.empty(0, dtype=str)
+        # the columns sorted by key
+        self._order = np.empty(0, dtype=np.intp)
+        self._columns = {}
+
+    def _object_column(self, rows, key):
+        values = np.empty(len(rows), dtype=object)
+        values[:] = [row.get(key) for row in rows]
+        return values
+
+    def diff(self, rows):
+        """
+        Replace the snapshot with rows and return its ChangeSet.
+        """
+        if rows is self._rows:
+            # e.g. the same cached response of a conditional request
+            return ChangeSet({}, {}, [])
+        if self.schema is None:
+            # only the numbers are converted, the rest (e.g. the benchmarks
+            # or the timestamps) are compared as they come
+            self.schema = tuple(
+                column if column.kind == gbm.columnar.FLOAT
+                else column._replace(kind=gbm.columnar.OBJECT)
+                for column in gbm.columnar.infer_schema(rows)
+                if column.key != self.key
+            )
+        keys = np.array([row[self.key] for row in rows], dtype=str)
+        columns = {
+            column.key: (
+                self._object_column(rows, column.key)
+                if column.kind == gbm.columnar.OBJECT
+                else gbm.columnar.to_columns(rows, (column,))[column.name]
+            )
+            for column in self.schema
+        }
+
+        # match the new rows with the old ones by key
+        old_keys = self._keys[self._order]
+        positions = np.searchsorted(old_keys, keys)
+        found = positions < len(old_keys)
+        found[found] = old_keys[positions[found]] == keys[found]
+        old_index = self._order[positions[found]]
+        new_index = np.flatnonzero(found)
+
+        changes = np.zeros((len(new_index), len(self.schema)), dtype=bool)
+        if len(new_index):
+            for number, column in enumerate(self.schema):
+                changes[:, number] = _different(
+                    self._columns[column.key][old_index],
+                    columns[column.key][new_index]
+                )
+        changed = changes.any(axis=1)
+        updated = {}
+        for row_changes, index in zip(changes[changed], new_index[changed]):
+            row = rows[index]
+            updated[row[self.key]] = {
+                self.schema[number].key: row.get(self.schema[number].key)
+                for number in np.flatnonzero(row_changes)
+            }
+        added = {rows[index][self.key]: rows[index]
+                 for index in np.flatnonzero(~found)}
+        still_there = np.zeros(len(self._keys), dtype=bool)
+        still_there[old_index] = True
+        removed = self._keys[~still_there].tolist()
+
+        self._rows = rows
+        self._keys = keys
+        self._order = np.argsort(keys, kind='stable')
+        self._columns = columns
+        return ChangeSet(added, updated, removed)
+
+    def snapshot(self):
+        """
+        The rows of the last snapshot.
+        """
+        return self._rows
+
+
+class MarketMonitor:
+    """
+    Poll market_price_monitor_detail of market (a
+    gbm.old_digital_api.api.Market) for each one of the instrument_types
+    and send the change sets to the subscribers.
+    """
+
+    def __init__(self, market, instrument_types=(0, 2)):
+        self.market = market
+        self.differs = {
+            instrument_type: SnapshotDiffer()
+            for instrument_type in instrument_types
+        }
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback):
+        """
+        Call callback(instrument_type, change_set) on every poll with
+        changes.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def poll(self):
+        """
+        Fetch the snapshot of every instrument type, return a dict of
+        instrument_type -> ChangeSet of the ones that changed.
+        """
+        changes = {}
+        for instrument_type, differ in self.differs.items():
+            rows = self.market.market_price_monitor_detail(instrument_type)
+            with self._lock:
+                change_set = differ.diff(rows)
+            if any(change_set):
+                changes[instrument_type] = change_set
+        for instrument_type, change_set in changes.items():
+            for callback in list(self._subscribers):
+                try:
+                    callback(instrument_type, change_set)
+                except Exception:
+                    logger.exception("Error on the monitor subscriber %r",
+                                     callback)
+        return changes
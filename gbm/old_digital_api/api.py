@@ -1,9 +1,27 @@
+import collections
+import datetime
 import enum
+import itertools
+import time
 import urllib.parse
 
 import requests
 
-import gbm.common
+import gbm.cache
+import gbm.columnar
+import gbm.concurrency
+import gbm.decoding
+import gbm.ratelimit
+import gbm.transport
+import gbm.urls
+from gbm.exceptions import APIError
+from gbm.old_digital_api import common, records
+
+# keep-alive pool shared by all the segments, see pool_stats
+_http = gbm.transport.PooledSession()
+
+# rows per page of Portfolio.iter_transactions
+TRANSACTIONS_PAGE_SIZE = 500
 
 
 class InstrumentType(enum.Enum):
@@ -15,6 +33,34 @@ class InstrumentType(enum.Enum):
     SIC = 2
 
 
+def _is_end_of_transactions(row):
+    # the empty response of GetTransactions, see Portfolio.transactions
+    return not (row.get('transactionsId') or row.get('transactionTypeId')
+                or row.get('transactionsRowNumber'))
+
+
+def _is_transient(error):
+    # the errors of a chunk worth fetching again in smaller chunks
+    if isinstance(error, APIError):
+        return error.status_code >= 500
+    return isinstance(error, (requests.Timeout, requests.ConnectionError))
+
+
+def _parse_iso(value):
+    # fromisoformat doesn't take the Z suffix before python 3.11
+    if value.endswith('Z'):
+        value = value[:-1] + '+00:00'
+    return datetime.datetime.fromisoformat(value)
+
+
+def pool_stats():
+    """
+    Return the stats of the connection pool shared by the segments, see
+    gbm.transport.PooledSession.pool_stats.
+    """
+    return _http.pool_stats()
+
+
 def get_itype_value(instrument_type):
     """
     Return the value for the instrument type/enum and validate for valid types.
@@ -65,6 +111,8 @@ class GBMAPI:
 
 
 class _APISegment:
+    cache = gbm.cache.default_cache
+    validators = gbm.cache.default_validators
 
     def __init__(self, session=None):
         self.session = session
@@ -76,25 +124,83 @@ class _APISegment:
             parent=None,
             headers=None, # ignore the session if this is not None
             raw=False, # return the whole request object
+            cache_ttl=None, # seconds to cache the response
+            stale_ttl=0, # seconds to serve it while it's refreshed
+            conditional=False, # send the validators of the last response
+            output='json', # see gbm.decoding, e.g. 'bytes' for the raw body
+            record=None, # the records.Record of output='records'
+            columns=None, # the gbm.columnar schema of output='columns'/'array'
             **kwargs):
+        if output == records.RECORDS and record is None:
+            raise Exception("There are no records for {}".format(fragment))
+        if output == records.RECORDS or output in gbm.columnar.OUTPUTS:
+            value = self._apicall(
+                fragment, *args, method=method, parent=parent,
+                headers=headers, cache_ttl=cache_ttl, stale_ttl=stale_ttl,
+                conditional=conditional, **kwargs
+            )
+            if output in gbm.columnar.OUTPUTS:
+                return gbm.columnar.convert(value, output, columns)
+            elif isinstance(value, list):
+                return record.decode_many(value)
+            return record.decode(value)
         if parent is None:
             parent = self.__class__.__name__
         if headers is None:
             if self.session is None:
                 raise Exception("There is no headers or session to make the request.")
             headers = self.session.headers
-        path = gbm.common.gbm_url(parent + '/' + fragment)
-        if method == 'post':
-            reqmethod = requests.post
-        elif method == 'get':
-            reqmethod = requests.get
-        else:
+        path = common.gbm_url(parent + '/' + fragment)
+        if method not in ('post', 'get'):
             raise Exception("Unsupported method {}".format(method))
-        rsp = reqmethod(path, headers=headers, **kwargs)
-        if raw:
+
+        key = gbm.cache.make_key(
+            method, path, kwargs.get('json'),
+            headers.get('GBMDigitalIdentityUser')
+        )
+
+        def send(validate=conditional, **send_kwargs):
+            send_headers = headers
+            if validate and output == gbm.decoding.JSON:
+                send_headers = dict(headers, **self.validators.headers(key))
+            send_kwargs.update(kwargs)
+            return gbm.ratelimit.throttled(
+                gbm.ratelimit.limiter_for(gbm.urls.OLD_API_BASE_URL, parent),
+                lambda: _http.request(method.upper(), path,
+                                      headers=send_headers, **send_kwargs)
+            )
+
+        def decode(rsp):
+            return gbm.decoding.loads(rsp.content)
+
+        def checked(rsp):
+            # the errors are never cached nor validated
+            if rsp.status_code >= 400:
+                raise APIError(rsp.status_code, rsp.text)
             return rsp
+
+        def fetch():
+            rsp = checked(send())
+            if conditional:
+                try:
+                    value = self.validators.resolve(key, rsp, decode)
+                except gbm.cache.NotModifiedMissing:
+                    rsp = checked(send(validate=False))
+                    value = self.validators.resolve(key, rsp, decode)
+            else:
+                value = decode(rsp)
+            return value, len(rsp.content)
+
+        if raw:
+            return send()
+        elif output == gbm.decoding.STREAM:
+            return gbm.decoding.stream_rows(checked(send(stream=True)))
+        elif output != gbm.decoding.JSON:
+            return gbm.decoding.decode_body(checked(send()).content, output)
+        elif cache_ttl is None:
+            return fetch()[0]
         else:
-            return rsp.json()
+            return self.cache.fetch(key, fetch, cache_ttl, stale_ttl)
 
 
 class AppManagement(_APISegment):
@@ -327,7 +433,7 @@ class AppManagement(_APISegment):
            "isDefault": false}
         ]
         """
-        return self._apicall('GetCultures', method='get')
+        return self._apicall('GetCultures', method='get', cache_ttl=86400)
 
     def user_app_configuration(self):
         """
@@ -516,13 +622,20 @@ class ContractManagement(_APISegment):
 
 
 class Market(_APISegment):
+    # days of the chunks of chunked_historic_price
+    historic_chunk_days = gbm.concurrency.AdaptiveSize(365, 30, 3650)
 
-    def capital_market_historic_price(self, issue_id, instrument_type, start_date, end_date):
+    def capital_market_historic_price(self, issue_id, instrument_type,
+                                      start_date, end_date, output='json'):
         """
         One of the primary methods to get the historic data.
 
         `start_date` and `end_date` must be iso encoded datestrings
 
+        With output='records' return a list of records.HistoricPrice, with
+        output='columns' or 'array' the NumPy arrays of gbm.columnar.BARS,
+        see gbm.old_digital_api.records and gbm.columnar.
+
         URL: GetCapitalMarketHistoricPrice
         Method: POST
         Body:
@@ -544,10 +657,80 @@ class Market(_APISegment):
             'isOnline': True,
             'startDate': start_date,
             'endDate': end_date
-        })
+        }, output=output, record=records.HistoricPrice,
+            columns=gbm.columnar.BARS)
+
+    def chunked_historic_price(self, issue_id, instrument_type, start_date,
+                               end_date, max_workers=4, output='json'):
+        """
+        capital_market_historic_price of a long range, split in chunks of
+        days fetched concurrently by max_workers threads and merged in
+        order, without the duplicated days of the boundaries.
+
+        The days of the chunks follow historic_chunk_days (shared by all
+        the calls) to keep every request at a few seconds, a chunk that
+        times out or fails with a server error is split in two and fetched
+        again until it's of the minimum size. Any other error, e.g. of an
+        unknown issue_id, is raised right away.
+        """
+        start, end = _parse_iso(start_date), _parse_iso(end_date)
+        sizer = self.historic_chunk_days
+
+        def fetch(chunk):
+            began = time.monotonic()
+            rows = self.capital_market_historic_price(
+                issue_id, instrument_type,
+                chunk[0].isoformat(), chunk[1].isoformat()
+            )
+            sizer.observe((chunk[1] - chunk[0]).days or 1,
+                          time.monotonic() - began)
+            return rows
+
+        chunks = {}
+        retry = collections.deque()
+        next_start = start
+        while next_start is not None or retry:
+            wave = [retry.popleft()
+                    for _ in range(min(len(retry), max_workers))]
+            while len(wave) < max_workers and next_start is not None:
+                chunk_end = min(
+                    next_start + datetime.timedelta(days=sizer.size), end
+                )
+                wave.append((next_start, chunk_end))
+                next_start = chunk_end if chunk_end < end else None
+            for result in gbm.concurrency.fan_out(fetch, wave, max_workers):
+                chunk = result.key
+                if result.error is None:
+                    chunks[chunk[0]] = result.value
+                    continue
+                if not _is_transient(result.error):
+                    raise result.error
+                sizer.failed()
+                days = (chunk[1] - chunk[0]).days
+                if days <= sizer.minimum:
+                    raise result.error
+                middle = chunk[0] + datetime.timedelta(days=days // 2)
+                retry.extend([(chunk[0], middle), (middle, chunk[1])])
+
+        rows, seen = [], set()
+        for chunk_start in sorted(chunks):
+            for row in chunks[chunk_start]:
+                if row['date'] not in seen:
+                    seen.add(row['date'])
+                    rows.append(row)
+        if output in gbm.columnar.OUTPUTS:
+            return gbm.columnar.convert(rows, output, gbm.columnar.BARS)
+        elif output == records.RECORDS:
+            return records.HistoricPrice.decode_many(rows)
+        return rows
+
+    def instrument_prices_intraday_complete(self, instrument, request=60,
+                                            output='json'):
+        """
+        With output='records' return a list of records.HistoricPrice, with
+        output='columns' or 'array' the NumPy arrays of gbm.columnar.BARS,
+        see gbm.old_digital_api.records and gbm.columnar.
 
-    def instrument_prices_intraday_complete(self, instrument, request=60):
-        """
         URL: GetInstrumentPricesIntradayComplete/<url-encoded-instrument>
         Method: POST
         Body:
@@ -566,12 +749,17 @@ class Market(_APISegment):
         return self._apicall('GetInstrumentPricesIntradayComplete/' + instrument, json={
             'IsOnline': True,
             'request': request
-        })
+        }, output=output, record=records.HistoricPrice,
+            columns=gbm.columnar.BARS)
 
-    def instrument_prices_intraday_ppp(self, instrument_id):
+    def instrument_prices_intraday_ppp(self, instrument_id, output='json'):
         """
         The same as complete intraday but with Precio Promedio Ponderado (weighted average price).
 
+        With output='records' return a list of records.IntradayPrice, with
+        output='columns' or 'array' the NumPy arrays of gbm.columnar.PRICES,
+        see gbm.old_digital_api.records and gbm.columnar.
+
         This method is used on the simple chart widget.
 
         URL: GetInstrumentPricesIntradayPPP/<instrument-id>
@@ -591,12 +779,18 @@ class Market(_APISegment):
         instrument_id = urllib.parse.quote(instrument_id)
         return self._apicall('GetInstrumentPricesIntradayPPP/' + instrument_id, json={
             'IsOnLine': True
-        })
+        }, output=output, record=records.IntradayPrice,
+            columns=gbm.columnar.PRICES)
 
 
 
-    def market_price_monitor_detail(self, instrument_type=InstrumentType.BMV):
+    def market_price_monitor_detail(self, instrument_type=InstrumentType.BMV,
+                                    output='json'):
         """
+        With output='bytes' return the undecoded body, with output='stream'
+        an iterator of the rows parsed while they are downloaded, see
+        gbm.decoding, and with output='records' a list of records.MonitorRow.
+
         URL: GetMarketPriceMonitorDetail
         Method: POST
         Body:
@@ -683,16 +877,21 @@ class Market(_APISegment):
             }, ...
         ]
         """
-        return self._apicall('GetMarketPriceMonitorDetail', json={
+        return self._apicall('GetMarketPriceMonitorDetail', conditional=True,
+                             output=output, record=records.MonitorRow, json={
             'isOnLine': True,
             'instrumentType': get_itype_value(instrument_type)
         })
 
 
-    def index_intraday(self, index_id):
+    def index_intraday(self, index_id, output='json'):
         """
         Use commodities_by_type with None to get the available indices.
 
+        With output='records' return a list of records.IntradayPrice, with
+        output='columns' or 'array' the NumPy arrays of gbm.columnar.PRICES,
+        see gbm.old_digital_api.records and gbm.columnar.
+
         URL: GetIndexIntraday/<index>
         Method: POST
         Body:
@@ -705,7 +904,8 @@ class Market(_APISegment):
         """
         return self._apicall('GetIndexIntraday/' + urllib.parse.quote(index_id), json={
             'IsOnline': True
-        })
+        }, output=output, record=records.IntradayPrice,
+            columns=gbm.columnar.PRICES)
 
 
     def commodities_by_type(self, commodity_type=-3):
@@ -766,7 +966,8 @@ class Market(_APISegment):
           [{"instrumentType":2,"issueID":"IBM *",
            "issueName":"INTERNATIONAL BUSINESS MACHINES CORP."}, ...]
         """
-        return self._apicall('SearchIssue/' + urllib.parse.quote(issue_query), method='get')
+        return self._apicall('SearchIssue/' + urllib.parse.quote(issue_query),
+                             method='get', cache_ttl=3600, stale_ttl=86400)
 
     def watchlist(self):
         """
@@ -777,10 +978,15 @@ class Market(_APISegment):
            ...,
            {"watchListTypeId":7,"configuration":"","title":"<title-for-7>"}]
         """
-        return self._apicall('GetWatchList', method='get')
+        return self._apicall('GetWatchList', method='get',
+                             cache_ttl=300, stale_ttl=3600)
 
-    def watch_list_detail(self, watch_list_type):
+    def watch_list_detail(self, watch_list_type, output='json'):
         """
+        With output='stream' return an iterator of the rows parsed while
+        they are downloaded, see gbm.decoding, and with output='records' a
+        list of records.WatchListInstrument.
+
         URL: GetWatchListDetail
         Method: POST
         Body:
@@ -803,12 +1009,15 @@ class Market(_APISegment):
         return self._apicall('GetWatchListDetail', json={
             'watchListType': watch_list_type,
             'isOnline': True
-        })
+        }, output=output, record=records.WatchListInstrument)
 
 
     # datos de transacciones en el mercado
-    def l2_market_data(self, instrument_id):
+    def l2_market_data(self, instrument_id, output='json'):
         """
+        With output='records' return a list of records.L2Level, see
+        gbm.old_digital_api.records.
+
         URL: /GetL2MarketData/<url-encoded-instrument>
         Method: GET
         Response:
@@ -826,12 +1035,17 @@ class Market(_APISegment):
         ]
         """
         instrument_id = urllib.parse.quote(instrument_id)
-        return self._apicall('GetL2MarketData/' + instrument_id, method='get')
+        return self._apicall('GetL2MarketData/' + instrument_id, method='get',
+                             output=output, record=records.L2Level)
 
-    def md_market_data(self, instrument_id):
+    def md_market_data(self, instrument_id, output='json'):
         """
         Get the trading information from all the participants.
 
+        With output='bytes' return the undecoded body, with output='stream'
+        an iterator of the rows parsed while they are downloaded, see
+        gbm.decoding, and with output='records' a list of records.Trade.
+
         URL: GetMDMarketData/<instrument-id>
         Method: GET
         Response:
@@ -849,10 +1063,14 @@ class Market(_APISegment):
            'typeOper': 'CO'}, ...]
         """
         instrument_id = urllib.parse.quote(instrument_id)
-        return self._apicall('GetMDMarketData/'+ instrument_id, method='get')
+        return self._apicall('GetMDMarketData/'+ instrument_id, method='get',
+                             output=output, record=records.Trade)
 
-    def company_share_percentage(self, instrument_id):
+    def company_share_percentage(self, instrument_id, output='json'):
         """
+        With output='records' return a list of records.BrokerShare, see
+        gbm.old_digital_api.records.
+
         URL: GetCompanySharePercentage/<instrument-id>
         Method: POST
         Response:
@@ -865,7 +1083,8 @@ class Market(_APISegment):
           'volume': 15941}, ...]
         """
         instrument_id = urllib.parse.quote(instrument_id)
-        return self._apicall('GetCompanySharePercentage/' + instrument_id)
+        return self._apicall('GetCompanySharePercentage/' + instrument_id,
+                             output=output, record=records.BrokerShare)
 
     # el blotter esta en operacion
 
@@ -879,7 +1098,7 @@ class Operation(_APISegment):
         Response:
            {"response":0.16}
         """
-        return self._apicall('GetIVA', method='get')
+        return self._apicall('GetIVA', method='get', cache_ttl=86400)
 
     def available_funds_for_trade(self):
         """
@@ -926,8 +1145,12 @@ class Operation(_APISegment):
             'contractId': contract_id
         })
 
-    def blotter_capital_market(self, instrument_types, orders_id, process_date, contract_id):
+    def blotter_capital_market(self, instrument_types, orders_id,
+                               process_date, contract_id, output='json'):
         """
+        With output='records' return a list of records.BlotterOrder, see
+        gbm.old_digital_api.records.
+
         URL: GetBlotterCapitalMarket
         Method: POST
         Body:
@@ -961,15 +1184,18 @@ class Operation(_APISegment):
             'ordersId': orders_id,
             'processDate': process_date,
             'contractId': contract_id
-        })
+        }, output=output, record=records.BlotterOrder)
 
 
 
 class Portfolio(_APISegment):
 
     def transactions(self, contract_id, process_date, start_date, end_date,
-                     **params):
+                     output='json', **params):
         """
+        With output='records' return a list of records.Transaction, see
+        gbm.old_digital_api.records.
+
         URL: GetTransactions
         Method: POST
         Body:
@@ -1004,11 +1230,63 @@ class Portfolio(_APISegment):
             "contractId": str(contract_id),
             "ascendent": params.get('ascendent', True),
             "rowNumber": params.get('row_number', None)
-        })
-
+        }, output=output, record=records.Transaction)
+
+    def iter_transactions(self, contract_id, start_date, end_date,
+                          process_date=None, page_size=TRANSACTIONS_PAGE_SIZE,
+                          prefetch=4, output='json', **params):
+        """
+        Generator of the transactions of contract_id between start_date
+        and end_date, the rows (or the records.Transaction with
+        output='records') of every page of transactions are yielded while
+        the next prefetch pages are fetched concurrently.
+
+        The pages are asked of page_size rows, if the first page is
+        shorter without the end record its length is taken as the size the
+        server allows and the rest of the pages are asked of that size. It
+        stops on the first short or empty page or at the all-zero end
+        record. process_date is now by default, the params are the ones of
+        transactions.
+        """
+        if process_date is None:
+            process_date = datetime.datetime.now(
+                datetime.timezone.utc
+            ).isoformat()
+
+        def page(index, size):
+            rows = self.transactions(
+                contract_id, process_date, start_date, end_date,
+                page_index=index, page_size=size, **params
+            )
+            if isinstance(rows, dict):
+                rows = [rows]
+            ended = any(_is_end_of_transactions(row) for row in rows)
+            if ended:
+                rows = [row for row in rows
+                        if not _is_end_of_transactions(row)]
+            if output == records.RECORDS:
+                rows = records.Transaction.decode_many(rows)
+            return rows, ended
+
+        rows, ended = page(0, page_size)
+        yield from rows
+        if ended or not rows:
+            return
+        # a short first page is either the only one or capped by the
+        # server, the next page tells them apart
+        page_size = min(page_size, len(rows))
+        for rows, ended in gbm.concurrency.prefetched(
+                lambda index: page(index, page_size),
+                itertools.count(1), prefetch):
+            yield from rows
+            if ended or len(rows) < page_size:
+                return
+
+    def position(self, contract_id, output='json'):
+        """
+        With output='records' return a list of records.Position, see
+        gbm.old_digital_api.records.
 
-    def position(self, contract_id):
-        """
         positionValueType
            1.- Largo
            5.- Fondos de inversion
@@ -1035,7 +1313,7 @@ class Portfolio(_APISegment):
         """
         return self._apicall('GetPosition', json={
             'contractId': contract_id
-        })
+        }, output=output, record=records.Position)
 
     def capital_transactions_amount_by_range(self, contract_id, start_date, end_date, global_contract=False):
         """
@@ -1082,7 +1360,7 @@ class Security(_APISegment):
         **This method does not depends on the security headers.**
         """
         if public_ip is not None:
-            headers = gbm.common.base_headers(**{
+            headers = common.base_headers(**{
                 'X-Forwarded-For': public_ip
             })
         else:
@@ -1114,7 +1392,7 @@ class Security(_APISegment):
         "alias":"<reducted>","timeExpiresReadSession":480,"timeExpiresOperationSession":20}
         """
         if public_ip is not None:
-            headers = gbm.common.base_headers(**{
+            headers = common.base_headers(**{
                 'X-Forwarded-For': public_ip
             })
         else:
@@ -1179,7 +1457,8 @@ class Utilities(_APISegment):
 
         **This method does not depends on the security headers.**
         """
-        rsp = self._apicall('GetPublicIP', method='get', headers=gbm.common.base_headers())
+        rsp = self._apicall('GetPublicIP', method='get',
+                            headers=common.base_headers())
         return rsp['response']
 
     def central_hour(self):
@@ -0,0 +1,285 @@
+"""
+Slotted record classes for the rows returned by the old digital API.
+
+The shape of every record is declared once as a schema, a sequence of
+fields mapping the camelCase keys of the JSON to snake_case attributes.
+From it a decoder function is compiled that builds the record straight
+from the parsed JSON, without any per-row loop over the keys. Keys that
+are not in the schema end up on the `extra` attribute (None otherwise),
+and keys missing from a row are set to None. The timestamps are decoded
+to datetimes in UTC, see time_field.
+
+Use output='records' on the endpoints that support it, or decode the
+already parsed JSON with e.g. `L2Level.decode_many(rows)`.
+"""
+import collections
+import datetime
+import re
+
+import gbm.timestamps
+
+# the output of the endpoints that return the records of this module
+RECORDS = 'records'
+
+Field = collections.namedtuple(
+    'Field', 'key attr convert time', defaults=(False,)
+)
+
+
+def snake_case(key):
+    """
+    >>> snake_case('issueID')
+    'issue_id'
+    """
+    return re.sub(r'([a-z0-9])([A-Z]+)', r'\1_\2', key).lower()
+
+
+def field(key, attr=None, convert=None):
+    """
+    Field of the JSON key, stored on the attribute attr (the snake case of
+    the key by default), after calling convert on its value when it is not
+    None.
+    """
+    return Field(key, attr or snake_case(key), convert)
+
+
+def time_field(key, attr=None):
+    """
+    Field of a timestamp, decoded to an aware datetime in UTC (None for the
+    placeholder dates), see gbm.timestamps. The timestamps of decode_many
+    are decoded all at once.
+    """
+    return Field(key, attr or snake_case(key), None, True)
+
+
+def nested(key, record_cls, many=False, attr=None):
+    """
+    Field holding another record, or a list of them if many is True.
+    """
+    convert = record_cls.decode_many if many else record_cls.decode
+    return field(key, attr, convert)
+
+
+def _as_field(spec):
+    if isinstance(spec, Field):
+        return spec
+    if isinstance(spec, str):
+        return field(spec)
+    return field(*spec)
+
+
+def _to_json(value):
+    if isinstance(value, Record):
+        return value.to_json()
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _compile_decoder(cls, name, lookup, on_missing):
+    # A decoder is a straight sequence of assignments, one per field, e.g.:
+    #
+    #   def decode(row):
+    #       obj = _new(_cls)
+    #       obj.issue_id = row['issueID']
+    #       value = row['instrument']
+    #       obj.instrument = None if value is None else _convert_4(value)
+    #       ...
+    #
+    # lookup is the expression used to get the key of the row.
+    namespace = {'_new': object.__new__, '_cls': cls}
+    lines = ['def {}(row):'.format(name), '    obj = _new(_cls)']
+    for i, f in enumerate(cls._schema):
+        value = lookup.format(repr(f.key))
+        if f.convert is None:
+            lines.append('    obj.{} = {}'.format(f.attr, value))
+        else:
+            namespace['_convert_{}'.format(i)] = f.convert
+            lines.append('    value = {}'.format(value))
+            lines.append(
+                '    obj.{} = None if value is None else _convert_{}(value)'
+                .format(f.attr, i)
+            )
+    lines.append('    ' + on_missing)
+    lines.append('    return obj')
+    exec('\n'.join(lines), namespace)
+    return namespace[name]
+
+
+class Record:
+    """
+    Base of the record classes, they are created with `record`.
+    """
+    __slots__ = ()
+    _schema = ()
+
+    def __init__(self, **fields):
+        for f in self._schema:
+            setattr(self, f.attr, fields.pop(f.attr, None))
+        self.extra = fields.pop('extra', None)
+        if fields:
+            raise TypeError("Unknown fields {}".format(sorted(fields)))
+
+    @classmethod
+    def _decode_row(cls, row):
+        # the row has all the keys of the schema and nothing else in
+        # the common case, so the extra keys are only collected when the
+        # length doesn't match
+        try:
+            obj = cls._decode_exact(row)
+        except KeyError:
+            return cls._decode_partial(row)
+        if len(row) != len(cls._schema):
+            obj.extra = cls._extra(row)
+        return obj
+
+    @classmethod
+    def decode(cls, row):
+        """
+        Build a record from the dict of a parsed JSON object.
+        """
+        obj = cls._decode_row(row)
+        for attr in cls._times:
+            setattr(obj, attr, gbm.timestamps.parse_time(getattr(obj, attr)))
+        return obj
+
+    @classmethod
+    def decode_many(cls, rows):
+        objs = list(map(cls._decode_row, rows))
+        for attr in cls._times:
+            times = gbm.timestamps.to_datetimes(
+                [getattr(obj, attr) for obj in objs]
+            )
+            for obj, value in zip(objs, times):
+                setattr(obj, attr, value)
+        return objs
+
+    @classmethod
+    def _extra(cls, row):
+        known = cls._known
+        return {key: value for key, value in row.items()
+                if key not in known} or None
+
+    def to_json(self):
+        """
+        The record as the dict with the original keys of the API.
+        """
+        data = {f.key: _to_json(getattr(self, f.attr)) for f in self._schema}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, ", ".join(
+            "{}={!r}".format(f.attr, getattr(self, f.attr))
+            for f in self._schema
+        ))
+
+
+def record(name, schema):
+    """
+    Create a slotted Record subclass from schema, a sequence of Field, JSON
+    keys or (key, attr[, convert]) tuples.
+    """
+    schema = tuple(_as_field(spec) for spec in schema)
+    cls = type(name, (Record,), {
+        '__slots__': tuple(f.attr for f in schema) + ('extra',),
+        '__module__': __name__,
+        '_schema': schema,
+        '_known': frozenset(f.key for f in schema),
+        '_times': tuple(f.attr for f in schema if f.time),
+    })
+    cls._decode_exact = staticmethod(
+        _compile_decoder(cls, 'decode_exact', 'row[{}]', 'obj.extra = None')
+    )
+    cls._decode_partial = staticmethod(_compile_decoder(
+        cls, 'decode_partial', 'row.get({})', 'obj.extra = _cls._extra(row)'
+    ))
+    return cls
+
+
+Benchmark = record('Benchmark', [
+    'benchmarkId', 'benchmarkName', 'benchmarkDesc', 'benchmarkPercentage',
+])
+
+_INSTRUMENT = [
+    'symbol', 'serie', 'tipoValorIndeval', ('issueID', 'issue_id'),
+    'issueName', 'lastPrice', 'closePrice', 'sectorId',
+    nested('benchmarks', Benchmark, many=True),
+    'instrumentType', 'tradingLineId', 'minimumAmount', 'isFundOfFunds',
+]
+
+Instrument = record('Instrument', _INSTRUMENT)
+
+WatchListInstrument = record(
+    'WatchListInstrument', ['watchlistType'] + _INSTRUMENT
+)
+
+MonitorRow = record('MonitorRow', [
+    'aggregatedVolume', 'askPrice', 'askVolume',
+    ('averageVolume6M', 'average_volume_6m'),
+    nested('benchmarks', Benchmark, many=True),
+    'bidPrice', 'bidVolume', 'bursatilityType', 'closePrice',
+    'instrumentType', 'ipcParticipationRate', 'isFundOfFunds',
+    ('issueID', 'issue_id'), 'issueName', 'lastPrice', 'maxPrice', 'minPrice',
+    'minimumAmount', 'openPrice', 'percentageChange', 'ppp', 'sectorId',
+    'serie', 'symbol', 'tradingLineId', 'valueChange',
+])
+
+Position = record('Position', [
+    'positionType', 'averageCost', 'shares', 'positionValueType',
+    nested('instrument', Instrument), 'marketValue', 'custodyType',
+    time_field('positionDate'), 'portfolioId',
+])
+
+L2Level = record('L2Level', [
+    'sequence', 'buyNumOrders', 'buyPrice', 'buyVolume',
+    'sellNumOrders', 'sellPrice', 'sellVolume',
+])
+
+Trade = record('Trade', [
+    'sequence', time_field('time'), 'stockSeries', 'last', 'operationVolume',
+    'buyer', 'seller', 'typeOper', 'regType', 'oddLot', 'trans', 'issic',
+])
+
+BrokerShare = record('BrokerShare', [
+    'casaBolsa', 'descriptionOper', 'amount', 'averagePrice', 'volume',
+    'numOper', 'companySharePercentage',
+])
+
+HistoricPrice = record('HistoricPrice', [
+    time_field('date'), 'openPrice', 'maxPrice', 'minPrice', 'closePrice',
+    'percentageChange', 'volume',
+])
+
+IntradayPrice = record('IntradayPrice', [
+    time_field('date'), 'price', 'percentageChange', 'volume',
+])
+
+BlotterOrder = record('BlotterOrder', [
+    'sobId', 'preorderId', 'vigenciaId', ('mainOrderAMId', 'main_order_am_id'),
+    'accountId', 'instrumentType', time_field('processDate'),
+    'gbmIntProcessStatus',
+    'capitalOrderTypeId', 'algoTradingTypeId', 'treasuryOrderTypeId',
+    'bitBuy', 'issueId', 'price', 'averagePrice', 'originalQuantity',
+    'assignedQuantity', 'cancelQuantity', 'commision', 'iva', 'stopPrice',
+    'duration', 'triggerPrice', 'pegOffsetValue', 'maxFloor', 'minQty',
+    'isCancelable', 'predespachador', 'vigencia',
+])
+
+Transaction = record('Transaction', [
+    'transactionTypeId', 'subTransactionTypeId', 'transactionsId',
+    ('ammount', 'amount'), time_field('processDate'),
+    time_field('settlementDate'), 'contractId',
+    'transactionsRowNumber', 'transactionsPageId',
+])
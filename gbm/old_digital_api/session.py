@@ -10,7 +10,7 @@ import requests
 import gbm.utilities
 import gbm.api
 from gbm.exceptions import GBMException
-from gbm.common import (
+from gbm.old_digital_api.common import (
     gbm_url,
     base_headers,
     APPLICATION_ID
@@ -0,0 +1,255 @@
+"""
+In-memory L2 order books built from Market.l2_market_data.
+
+The books of all the instruments are the rows of a set of 2D NumPy
+arrays, one per field of the levels (instruments x levels), so a new
+snapshot is applied as the deltas of the levels that changed and the
+metrics can be computed for a single book or for all of them at once.
+
+The metric functions take the arrays with the levels on the last axis,
+the first level is the best one, and the empty levels are NaN.
+"""
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gbm.concurrency import fan_out
+from gbm.exceptions import GBMException
+
+logger = logging.getLogger(__name__)
+
+# attribute -> key of the rows of l2_market_data
+FIELDS = (
+    ('bid_orders', 'buyNumOrders'),
+    ('bid_price', 'buyPrice'),
+    ('bid_volume', 'buyVolume'),
+    ('ask_orders', 'sellNumOrders'),
+    ('ask_price', 'sellPrice'),
+    ('ask_volume', 'sellVolume'),
+)
+
+
+def _levels(rows, depth):
+    """
+    The fields of the level rows (with sequence 1 to depth) as arrays of
+    depth items.
+    """
+    levels = {name: np.full(depth, np.nan) for name, _ in FIELDS}
+    for row in rows:
+        level = row['sequence'] - 1
+        if 0 <= level < depth:
+            for name, key in FIELDS:
+                value = row.get(key)
+                levels[name][level] = np.nan if value is None else value
+    for side in ('bid', 'ask'):
+        # the sides with less levels have them in 0
+        empty = ~(levels[side + '_volume'] > 0)
+        for name, _ in FIELDS:
+            if name.startswith(side):
+                levels[name][empty] = np.nan
+    return levels
+
+
+def spread(bid_price, ask_price):
+    return ask_price[..., 0] - bid_price[..., 0]
+
+
+def mid_price(bid_price, ask_price):
+    return (ask_price[..., 0] + bid_price[..., 0]) / 2
+
+
+def microprice(bid_price, bid_volume, ask_price, ask_volume):
+    """
+    The mid price weighted by the volumes on the top of the book, closer
+    to the side with less volume.
+    """
+    bid_size, ask_size = bid_volume[..., 0], ask_volume[..., 0]
+    return ((bid_price[..., 0] * ask_size + ask_price[..., 0] * bid_size)
+            / (bid_size + ask_size))
+
+
+def level_weights(depth):
+    # the closer to the top of the book the more it weights
+    return 1 / np.arange(1, depth + 1)
+
+
+def imbalance(bid_volume, ask_volume, weights=None):
+    """
+    Depth weighted imbalance of the volumes, from -1 (only asks) to 1
+    (only bids), weights are the weights of the levels, see level_weights.
+    """
+    if weights is None:
+        weights = level_weights(bid_volume.shape[-1])
+    bids = np.nan_to_num(bid_volume) @ weights
+    asks = np.nan_to_num(ask_volume) @ weights
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (bids - asks) / (bids + asks)
+
+
+def cumulative_depth(volume):
+    return np.cumsum(np.nan_to_num(volume), axis=-1)
+
+
+class OrderBook:
+    """
+    The order book of a single instrument, a view of its row on
+    OrderBooks, the metrics are computed in O(1) or O(levels).
+    """
+    __slots__ = ('_books', '_row', 'instrument')
+
+    def __init__(self, books, row, instrument):
+        self._books = books
+        self._row = row
+        self.instrument = instrument
+
+    def __getattr__(self, name):
+        # the fields of the levels, e.g. book.bid_price
+        if name in self._books.levels:
+            return self._books.levels[name][self._row]
+        raise AttributeError(name)
+
+    @property
+    def best_bid(self):
+        return self.bid_price[0]
+
+    @property
+    def best_ask(self):
+        return self.ask_price[0]
+
+    @property
+    def spread(self):
+        return spread(self.bid_price, self.ask_price)
+
+    @property
+    def mid_price(self):
+        return mid_price(self.bid_price, self.ask_price)
+
+    @property
+    def microprice(self):
+        return microprice(self.bid_price, self.bid_volume,
+                          self.ask_price, self.ask_volume)
+
+    def imbalance(self, weights=None):
+        return imbalance(self.bid_volume, self.ask_volume, weights)
+
+    def cumulative_depth(self, side):
+        """
+        Cumulative volume of side ('bid' or 'ask') by level.
+        """
+        return cumulative_depth(getattr(self, side + '_volume'))
+
+    def __repr__(self):
+        return "<OrderBook {} {}/{}>".format(
+            self.instrument, self.best_bid, self.best_ask
+        )
+
+
+class OrderBooks:
+    """
+    The order books of many instruments with depth levels per side.
+    """
+
+    def __init__(self, depth=5, capacity=64):
+        if np is None:
+            raise GBMException(
+                "The order books require numpy, install the 'numpy' extra."
+            )
+        self.depth = depth
+        self.levels = {
+            name: np.full((capacity, depth), np.nan) for name, _ in FIELDS
+        }
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, instrument):
+        return instrument in self._rows
+
+    @property
+    def instruments(self):
+        return list(self._rows)
+
+    def _row(self, instrument):
+        try:
+            return self._rows[instrument]
+        except KeyError:
+            pass
+        row = len(self._rows)
+        capacity = len(self.levels['bid_price'])
+        if row == capacity:
+            for name, array in self.levels.items():
+                grown = np.full((capacity * 2, self.depth), np.nan)
+                grown[:capacity] = array
+                self.levels[name] = grown
+        self._rows[instrument] = row
+        return row
+
+    def apply(self, instrument, rows):
+        """
+        Apply the snapshot of l2_market_data rows to the book of
+        instrument, only the levels that changed are written.
+
+        Return the indices of the levels that changed.
+        """
+        new = _levels(rows, self.depth)
+        with self._lock:
+            row = self._row(instrument)
+            changed = np.zeros(self.depth, dtype=bool)
+            for name, values in new.items():
+                old = self.levels[name][row]
+                both_nan = np.isnan(old) & np.isnan(values)
+                changed |= (old != values) & ~both_nan
+            for name, values in new.items():
+                self.levels[name][row, changed] = values[changed]
+        return np.flatnonzero(changed)
+
+    def book(self, instrument):
+        return OrderBook(self, self._rows[instrument], instrument)
+
+    def metrics(self, instruments=None):
+        """
+        Dict of the arrays of the top of book metrics of instruments (all
+        by default), in the order of instruments.
+        """
+        with self._lock:
+            if instruments is None:
+                instruments = list(self._rows)
+            rows = [self._rows[instrument] for instrument in instruments]
+            levels = {name: array[rows] for name, array in self.levels.items()}
+        return {
+            'best_bid': levels['bid_price'][:, 0],
+            'best_ask': levels['ask_price'][:, 0],
+            'spread': spread(levels['bid_price'], levels['ask_price']),
+            'mid_price': mid_price(levels['bid_price'], levels['ask_price']),
+            'microprice': microprice(
+                levels['bid_price'], levels['bid_volume'],
+                levels['ask_price'], levels['ask_volume']
+            ),
+            'imbalance': imbalance(levels['bid_volume'], levels['ask_volume']),
+        }
+
+    def poll(self, market, instruments, max_workers=8):
+        """
+        Fetch the l2_market_data of every instrument with market (a
+        gbm.old_digital_api.api.Market) concurrently and apply it.
+
+        Return a dict instrument -> changed levels of the books that
+        changed, the failed fetches are logged and skipped.
+        """
+        changes = {}
+        for result in fan_out(market.l2_market_data, instruments,
+                              max_workers):
+            if result.error is not None:
+                logger.warning("Unable to poll %s: %s",
+                               result.key, result.error)
+                continue
+            changed = self.apply(result.key, result.value)
+            if len(changed):
+                changes[result.key] = changed
+        return changes
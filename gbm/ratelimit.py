@@ -0,0 +1,161 @@
+import asyncio
+import email.utils
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# the server is throttling the client
+THROTTLE_STATUS = (429, 503)
+
+
+def retry_after(rsp):
+    """
+    Return the seconds to wait from the Retry-After header of the
+    response, either in seconds or as an http date, or None if missing.
+    """
+    value = rsp.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """
+    Token bucket with an adaptive rate (AIMD).
+
+    Every successful request increases the rate by `increase` requests
+    per second and every throttled request multiplies it by `decrease`,
+    honoring the Retry-After of the server if any.
+
+    The callers are never rejected, each one reserves the next token
+    and sleeps until it is available, so they are served in order.
+    """
+
+    def __init__(self, rate=10.0, burst=10, min_rate=0.5, max_rate=100.0,
+                 increase=0.5, decrease=0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """
+        Take a token and return the seconds to wait before using it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait = max(0.0, self._blocked_until - now)
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+            return wait
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self, wait=None):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            # drop the burst, the reserved tokens keep their place
+            self._tokens = min(self._tokens, 0.0)
+            if wait is not None:
+                self._blocked_until = max(
+                    self._blocked_until, time.monotonic() + wait
+                )
+        logger.info("Throttled by the server, rate reduced to %.2f req/s",
+                    self.rate)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter_for(host, group, **bucket_kwargs):
+    """
+    Return the TokenBucket shared by every request to the group of
+    endpoints of the host, creating it with bucket_kwargs if needed.
+    """
+    with _limiters_lock:
+        key = (host, group)
+        if key not in _limiters:
+            _limiters[key] = TokenBucket(**bucket_kwargs)
+        return _limiters[key]
+
+
+def endpoint_group(url_segment):
+    """
+    The group of an endpoint is the first segment of its path,
+    e.g.: /markets/BMV/securities -> markets
+    """
+    return url_segment.strip('/').split('/', 1)[0]
+
+
+def throttled(limiter, send, max_retries=5):
+    """
+    Call send through the limiter, retrying while the server throttles
+    the response. Return the last response, the throttled ones before it
+    are closed.
+    """
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        rsp = send()
+        if rsp.status_code not in THROTTLE_STATUS:
+            limiter.on_success()
+            return rsp
+        limiter.on_throttle(retry_after(rsp))
+        if attempt < max_retries:
+            # give the connection back to the pool, e.g. of a streamed
+            # response that is never read
+            rsp.close()
+    return rsp
+
+
+async def async_throttled(limiter, send, max_retries=5):
+    """
+    Asyncio version of throttled, send must return an awaitable.
+    """
+    for attempt in range(max_retries + 1):
+        await limiter.acquire_async()
+        rsp = await send()
+        if rsp.status_code not in THROTTLE_STATUS:
+            limiter.on_success()
+            return rsp
+        limiter.on_throttle(retry_after(rsp))
+        if attempt < max_retries:
+            if hasattr(rsp, 'aclose'):
+                await rsp.aclose()
+            else:
+                # a blocking response, e.g. of the fallback to the driver
+                rsp.close()
+    return rsp
@@ -0,0 +1,101 @@
+"""
+Fixed-capacity ring buffers of columns.
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from gbm.exceptions import GBMException
+
+
+class ColumnRing:
+    """
+    The last capacity rows of a set of columns, each one a preallocated
+    NumPy array, the oldest rows are overwritten by the new ones.
+
+    The rows are addressed by their logical index, 0 is the oldest row.
+    """
+
+    def __init__(self, capacity, dtypes):
+        if np is None:
+            raise GBMException(
+                "The ring buffers require numpy, install the 'numpy' extra."
+            )
+        self.capacity = capacity
+        self._columns = {
+            name: np.empty(capacity, dtype=dtype)
+            for name, dtype in dtypes.items()
+        }
+        # physical index of the oldest row
+        self._first = 0
+        self._size = 0
+
+    @classmethod
+    def like(cls, capacity, columns):
+        """
+        Ring with the names and dtypes of the arrays of columns.
+        """
+        return cls(capacity, {
+            name: column.dtype for name, column in columns.items()
+        })
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def names(self):
+        return list(self._columns)
+
+    def _physical(self, indices):
+        return (self._first + indices) % self.capacity
+
+    def append(self, columns):
+        """
+        Append the rows of columns (a dict of arrays of the same length),
+        overwriting the oldest rows when full.
+        """
+        count = len(next(iter(columns.values())))
+        if count > self.capacity:
+            columns = {name: column[-self.capacity:]
+                       for name, column in columns.items()}
+            count = self.capacity
+        if not count:
+            return
+        positions = self._physical(self._size + np.arange(count))
+        for name, array in self._columns.items():
+            array[positions] = columns[name]
+        overflow = max(self._size + count - self.capacity, 0)
+        self._first = (self._first + overflow) % self.capacity
+        self._size += count - overflow
+
+    def put(self, indices, columns):
+        """
+        Overwrite the rows at the logical indices with the rows of columns.
+        """
+        positions = self._physical(np.asarray(indices))
+        for name, array in self._columns.items():
+            array[positions] = columns[name]
+
+    def column(self, name, start=0, stop=None):
+        """
+        Copy of the rows start:stop (logical, negative from the end) of
+        the column name, oldest first.
+        """
+        start, stop, _ = slice(start, stop).indices(self._size)
+        return self._columns[name][self._physical(np.arange(start, stop))]
+
+    def columns(self, start=0, stop=None):
+        return {name: self.column(name, start, stop) for name in self._columns}
+
+    def last(self, name):
+        """
+        The value of the newest row of the column name.
+        """
+        if not self._size:
+            raise IndexError("The ring is empty")
+        return self._columns[name][self._physical(self._size - 1)]
+
+    def clear(self):
+        self._first = 0
+        self._size = 0
@@ -0,0 +1,13 @@
+"""
+Push subscribers of the real-time market data of the Solace topics, the
+topics are resolved with the AppManagement methods of the old digital API.
+"""
+from gbm.streaming.broker import LocalBroker, LocalTransport
+from gbm.streaming.subscriber import Message, StreamSubscriber, decode_payload
+from gbm.streaming.topics import matches, resolve_topics
+
+
+__all__ = [
+    'LocalBroker', 'LocalTransport', 'Message', 'StreamSubscriber',
+    'decode_payload', 'matches', 'resolve_topics'
+]
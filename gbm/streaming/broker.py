@@ -0,0 +1,86 @@
+"""
+The message transports of the streaming subscribers.
+
+A transport is any object with:
+
+    connect(deliver): start receiving, calling deliver(topic, payload)
+        for every message, from any thread, payload is the raw bytes.
+    subscribe(subscription) and unsubscribe(subscription): add or remove
+        a subscription (see gbm.streaming.topics).
+    close()
+
+e.g. an adapter of the Solace messaging API. LocalBroker is an in-process
+stand-in to publish the messages by hand, for the tests and benchmarks.
+"""
+import json
+import threading
+
+from gbm.streaming.topics import matches
+
+
+class LocalTransport:
+    """
+    Transport connected to a LocalBroker, see LocalBroker.transport.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.subscriptions = set()
+        self._deliver = None
+
+    def connect(self, deliver):
+        self._deliver = deliver
+        self.broker._connect(self)
+
+    def subscribe(self, subscription):
+        self.subscriptions.add(subscription)
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def close(self):
+        self.broker._disconnect(self)
+        self._deliver = None
+
+    def _receive(self, topic, payload):
+        if any(matches(subscription, topic)
+               for subscription in tuple(self.subscriptions)):
+            self._deliver(topic, payload)
+            return True
+        return False
+
+
+class LocalBroker:
+    """
+    In-process broker, the messages published are delivered right away,
+    on the thread of the publisher, to the transports subscribed to them.
+    """
+
+    def __init__(self):
+        self._transports = []
+        self._lock = threading.Lock()
+
+    def transport(self):
+        return LocalTransport(self)
+
+    def _connect(self, transport):
+        with self._lock:
+            self._transports.append(transport)
+
+    def _disconnect(self, transport):
+        with self._lock:
+            if transport in self._transports:
+                self._transports.remove(transport)
+
+    def publish(self, topic, payload):
+        """
+        Publish payload on topic, payload is either the raw bytes or a
+        value that is encoded as JSON, return the number of transports
+        that received it.
+        """
+        if not isinstance(payload, bytes):
+            payload = json.dumps(payload).encode()
+        with self._lock:
+            transports = list(self._transports)
+        return sum(transport._receive(topic, payload)
+                   for transport in transports)
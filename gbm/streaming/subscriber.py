@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import logging
+import threading
+
+import gbm.decoding
+from gbm.streaming.topics import matches, service
+
+logger = logging.getLogger(__name__)
+
+# a decoded message, value is the parsed payload or its records
+Message = collections.namedtuple('Message', 'topic value')
+
+# the service of the topics -> the name of the record of its rows, the
+# same of the REST endpoint with the data, see decode_payload
+SERVICE_RECORDS = {
+    'MDWEB': 'MonitorRow',
+    'L2': 'L2Level',
+}
+
+
+def decode_payload(topic, payload, output=gbm.decoding.JSON):
+    """
+    Decode the payload of a message of topic as requested by output, the
+    output 'records' decodes the rows of the services of SERVICE_RECORDS
+    to the records of gbm.old_digital_api.records, the rest are kept as
+    JSON.
+    """
+    if output == gbm.decoding.BYTES:
+        return payload
+    value = gbm.decoding.loads(payload)
+    if output == gbm.decoding.JSON:
+        return value
+    elif output != 'records':
+        raise ValueError("Unknown output: {}".format(output))
+    name = SERVICE_RECORDS.get(service(topic))
+    if name is None:
+        return value
+    from gbm.old_digital_api import records
+    record = getattr(records, name)
+    if isinstance(value, list):
+        return record.decode_many(value)
+    return record.decode(value)
+
+
+class StreamSubscriber:
+    """
+    Receive the messages of the Solace topics through transport (see
+    gbm.streaming.broker) and hand them to the callbacks or the async
+    iterators subscribed to them.
+
+    The payload of a message is decoded once, with output (see
+    decode_payload), no matter how many subscribers it has.
+
+        subscriber = StreamSubscriber(transport, output='records')
+        for topic in resolve_topics(api.app_mgmt, 'l2'):
+            subscriber.subscribe(topic, on_levels)
+    """
+
+    def __init__(self, transport, output=gbm.decoding.JSON):
+        self.transport = transport
+        self.output = output
+        # subscription -> callbacks
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        transport.connect(self._deliver)
+
+    def subscribe(self, subscription, callback):
+        """
+        Call callback(message) with the Message of every message of the
+        topics of subscription, the callbacks run on the thread of the
+        transport.
+        """
+        with self._lock:
+            callbacks = self._callbacks.get(subscription)
+            if callbacks is None:
+                callbacks = self._callbacks[subscription] = []
+                self.transport.subscribe(subscription)
+            callbacks.append(callback)
+
+    def unsubscribe(self, subscription, callback):
+        with self._lock:
+            callbacks = self._callbacks[subscription]
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._callbacks[subscription]
+                self.transport.unsubscribe(subscription)
+
+    def _deliver(self, topic, payload):
+        with self._lock:
+            callbacks = [
+                callback
+                for subscription, subscribed in self._callbacks.items()
+                if matches(subscription, topic)
+                for callback in subscribed
+            ]
+        if not callbacks:
+            return
+        try:
+            message = Message(
+                topic, decode_payload(topic, payload, self.output)
+            )
+        except Exception:
+            logger.exception("Unable to decode the message of %s", topic)
+            return
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Error on the stream subscriber %r", callback)
+
+    async def messages(self, subscription, maxsize=0):
+        """
+        Async iterator of the messages of subscription, when the queue has
+        maxsize messages waiting (if not 0) the new ones are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize)
+
+        def put(message):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                logger.warning("Dropped a message of %s, the queue is full",
+                               message.topic)
+
+        def callback(message):
+            loop.call_soon_threadsafe(put, message)
+
+        self.subscribe(subscription, callback)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(subscription, callback)
+
+    def close(self):
+        with self._lock:
+            self._callbacks.clear()
+        self.transport.close()
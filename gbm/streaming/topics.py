@@ -0,0 +1,65 @@
+"""
+The Solace topics of the market data and how they are matched.
+
+The topics are levels separated by '/', e.g. dat/GBM/R/MDWEB/MEX/E/BMV/NAC/*,
+on a subscription '*' matches a whole level, 'prefix*' the levels that
+start with prefix and a final '>' one or more levels.
+"""
+import functools
+import re
+
+# the kind of topics -> the AppManagement method and the keys of its
+# response with the subscriptions
+KINDS = {
+    'data': ('solace_data_topic', 'dataSubscription'),
+    'aggregates': ('solace_data_topic', 'aggSubscription'),
+    'l2': ('solace_topic', 'dataSubscription'),
+    'indexes': ('solace_indexes_topic', 'suscription'),
+}
+
+
+def resolve_topics(app_mgmt, kind='data', **kwargs):
+    """
+    The subscriptions of kind (see KINDS) returned by app_mgmt, a
+    gbm.old_digital_api.api.AppManagement, the kwargs are passed to its
+    method, e.g. instruments=['AMXL'].
+    """
+    try:
+        method, key = KINDS[kind]
+    except KeyError:
+        raise ValueError("Unknown kind of topics: {}".format(kind)) from None
+    return list(getattr(app_mgmt, method)(**kwargs)[key])
+
+
+@functools.lru_cache(maxsize=1024)
+def _pattern(subscription):
+    levels = subscription.split('/')
+    parts = []
+    for number, level in enumerate(levels):
+        if level == '>' and number == len(levels) - 1:
+            parts.append('.+')
+        elif level.endswith('*'):
+            parts.append(re.escape(level[:-1]) + '[^/]*')
+        else:
+            parts.append(re.escape(level))
+    return re.compile('/'.join(parts))
+
+
+def matches(subscription, topic):
+    """
+    >>> matches('dat/GBM/R/L2/MEX/*', 'dat/GBM/R/L2/MEX/E')
+    True
+    >>> matches('dat/GBM/R/>', 'dat/GBM/R/L2/MEX')
+    True
+    >>> matches('dat/GBM/R/L2/*', 'dat/GBM/R/L2/MEX/E')
+    False
+    """
+    return _pattern(subscription).fullmatch(topic) is not None
+
+
+def service(topic):
+    """
+    The service of the data of topic, e.g. 'L2' or 'MDWEB'.
+    """
+    levels = topic.split('/')
+    return levels[3] if len(levels) > 3 else None
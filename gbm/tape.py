@@ -0,0 +1,234 @@
+"""
+Trade tapes built from the overlapping windows of Market.md_market_data.
+
+Every poll returns the last trades of an instrument, the Tape of the
+instrument drops the ones it already has by their sequence (a set lookup
+per trade), keeps the last capacity trades on a gbm.ring.ColumnRing and
+updates its VWAP and volume counters with just the new ones. The trades
+older than the ones kept are taken as already seen.
+
+A poll that doesn't overlap with the trades already seen means some
+trades were missed between the two windows, it's reported as a gap. If
+the sequences of an instrument are consecutive (contiguous=True) the
+holes between them are gaps too. md_market_data only returns the last
+trades, the trades of a gap can't be fetched again.
+"""
+import collections
+import logging
+import threading
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import gbm.timestamps
+from gbm.concurrency import fan_out
+from gbm.exceptions import GBMException
+from gbm.ring import ColumnRing
+
+logger = logging.getLogger(__name__)
+
+# the sequences of the last trade before and the first after the gap
+Gap = collections.namedtuple('Gap', 'after before')
+
+COLUMNS = {
+    'sequence': 'int64',
+    'time': 'datetime64[ns]',
+    'price': 'float64',
+    'volume': 'int64',
+    'buyer': object,
+    'seller': object,
+}
+
+
+class Tape:
+    """
+    The trades of an instrument and their running counters.
+    """
+
+    def __init__(self, instrument, capacity=4096, contiguous=False):
+        if np is None:
+            raise GBMException(
+                "The trade tapes require numpy, install the 'numpy' extra."
+            )
+        self.instrument = instrument
+        self.contiguous = contiguous
+        self.ring = ColumnRing(capacity, COLUMNS)
+        self.last_sequence = None
+        self.trade_count = 0
+        self.volume = 0
+        self.notional = 0.0
+        self.last_price = None
+        self.high = None
+        self.low = None
+        self._seen = set()
+        # the newest sequence no longer on _seen
+        self._floor = None
+
+    @property
+    def vwap(self):
+        return self.notional / self.volume if self.volume else None
+
+    def _gaps(self, sequences, overlaps):
+        last = self.last_sequence
+        if last is not None:
+            # the late trades fill the gaps already reported
+            sequences = sequences[sequences > last]
+            if not len(sequences):
+                return []
+        if not self.contiguous:
+            if last is None or overlaps:
+                return []
+            return [Gap(last, int(sequences[0]))]
+        if last is not None:
+            sequences = np.concatenate([[last], sequences])
+        holes = np.flatnonzero(np.diff(sequences) > 1)
+        return [Gap(int(sequences[hole]), int(sequences[hole + 1]))
+                for hole in holes]
+
+    def _is_new(self, sequence):
+        return (sequence not in self._seen
+                and (self._floor is None or sequence > self._floor))
+
+    def add(self, trades):
+        """
+        Add the trades (rows of md_market_data) not seen before.
+
+        Return the new trades, oldest first, and the list of Gap.
+        """
+        seen = self._seen
+        # by sequence, a window could repeat a trade
+        new = list({
+            trade['sequence']: trade for trade in trades
+            if self._is_new(trade['sequence'])
+        }.values())
+        overlaps = len(new) < len(trades)
+        if not new:
+            return new, []
+        new.sort(key=lambda trade: trade['sequence'])
+        sequences = np.array([trade['sequence'] for trade in new],
+                             dtype=np.int64)
+        gaps = self._gaps(sequences, overlaps)
+
+        prices = np.array([trade.get('last') for trade in new],
+                          dtype=np.float64)
+        volumes = np.array([trade.get('operationVolume') or 0
+                            for trade in new], dtype=np.int64)
+        capacity = self.ring.capacity
+        evicted = len(self.ring) + len(new) - capacity
+        dropped = []
+        if evicted > 0:
+            dropped = self.ring.column('sequence', 0, evicted).tolist()
+            seen.difference_update(dropped)
+        # the new trades that don't fit on the ring
+        dropped.extend(sequences[:-capacity].tolist())
+        if dropped:
+            floor = max(dropped)
+            self._floor = (floor if self._floor is None
+                           else max(self._floor, floor))
+        self.ring.append({
+            'sequence': sequences,
+            'time': gbm.timestamps.parse_times(
+                [trade.get('time') for trade in new]
+            ),
+            'price': prices,
+            'volume': volumes,
+            'buyer': [trade.get('buyer') for trade in new],
+            'seller': [trade.get('seller') for trade in new],
+        })
+        seen.update(sequences[-capacity:].tolist())
+
+        priced = ~np.isnan(prices)
+        self.trade_count += len(new)
+        self.volume += int(volumes[priced].sum())
+        self.notional += float(prices[priced] @ volumes[priced])
+        if priced.any():
+            self.last_price = float(prices[priced][-1])
+            high = float(prices[priced].max())
+            low = float(prices[priced].min())
+            self.high = high if self.high is None else max(self.high, high)
+            self.low = low if self.low is None else min(self.low, low)
+        self.last_sequence = max(int(sequences[-1]), self.last_sequence or 0)
+        return new, gaps
+
+    def trades(self):
+        """
+        Copy of the columns of the trades kept, oldest first.
+        """
+        return self.ring.columns()
+
+
+class Tapes:
+    """
+    The tapes of many instruments, fetched with fetch(instrument), e.g.
+    Market.md_market_data, see from_market.
+    """
+
+    def __init__(self, fetch, capacity=4096, contiguous=False):
+        self.fetch = fetch
+        self.capacity = capacity
+        self.contiguous = contiguous
+        self.tapes = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_market(cls, market, **kwargs):
+        return cls(market.md_market_data, **kwargs)
+
+    def subscribe(self, callback):
+        """
+        Call callback(instrument, new_trades, gaps) for every update with
+        new trades or gaps.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def tape(self, instrument):
+        with self._lock:
+            try:
+                return self.tapes[instrument]
+            except KeyError:
+                tape = self.tapes[instrument] = Tape(
+                    instrument, self.capacity, self.contiguous
+                )
+                return tape
+
+    def update(self, instrument, trades):
+        """
+        Add the polled trades of instrument, return the new trades and the
+        gaps.
+        """
+        tape = self.tape(instrument)
+        with self._lock:
+            new, gaps = tape.add(trades)
+        if new or gaps:
+            for callback in list(self._subscribers):
+                try:
+                    callback(instrument, new, gaps)
+                except Exception:
+                    logger.exception("Error on the tape subscriber %r",
+                                     callback)
+        return new, gaps
+
+    def poll(self, instruments, max_workers=8):
+        """
+        Fetch and add the trades of every instrument concurrently, see
+        gbm.concurrency.fan_out, the failed fetches are logged and skipped.
+
+        Return a dict instrument -> gaps of the instruments with gaps, to
+        poll them more often.
+        """
+        all_gaps = {}
+        for result in fan_out(self.fetch, instruments, max_workers):
+            if result.error is not None:
+                logger.warning("Unable to poll %s: %s",
+                               result.key, result.error)
+                continue
+            _, gaps = self.update(result.key, result.value)
+            if gaps:
+                all_gaps[result.key] = gaps
+        return all_gaps
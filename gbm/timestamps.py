@@ -0,0 +1,230 @@
+"""
+Decoding of the ISO 8601 timestamps of the API.
+
+The API sends the local time with its UTC offset and a variable number of
+digits of fraction, e.g. 2016-07-18T00:00:00-05:00,
+2016-08-10T14:59:32.183-05:00 or 2016-07-27T09:18:27.1489496-05:00 on
+Utilities.central_hour.
+
+parse_times converts a whole batch to a datetime64[ns] UTC array with
+vectorized NumPy operations over the characters of the strings: the
+offsets are looked up once per distinct suffix (cached across calls) and
+the date and time fields are computed with integer arithmetic from their
+fixed positions. parse_time is the pure Python counterpart for a single
+value, also used for the strings in any other layout.
+
+Nulls and the placeholder dates of the API, e.g. the 0001-01-01 of the
+empty records, are NaT on the arrays and None otherwise.
+"""
+import datetime
+import functools
+import re
+
+# numpy is imported on the first vectorized parse, not with gbm, see
+# _require_numpy
+np = None
+
+from gbm.exceptions import GBMException
+
+# the timestamps before this year are placeholders, datetime64[ns] can't
+# represent them anyway
+MIN_YEAR = 1678
+
+_OFFSET = re.compile(r'(Z|[+-]\d\d:\d\d)$')
+_TIMESTAMP = re.compile(
+    r'\d{4}-\d\d-\d\d(T\d\d:\d\d(:\d\d(\.\d+)?)?)?(Z|[+-]\d\d:\d\d)?'
+)
+
+# the fixed part of the local times, d are the digits
+_LAYOUT = 'dddd-dd-ddTdd:dd:dd'
+
+# suffix (the last 6 characters) -> (characters to strip, offset in ns)
+_suffixes = {}
+
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise GBMException(
+                "The vectorized timestamps require numpy, "
+                "install the 'numpy' extra."
+            ) from None
+        np = numpy
+
+
+@functools.lru_cache(maxsize=64)
+def _timezone(offset):
+    if offset in ('', 'Z'):
+        return datetime.timezone.utc
+    sign = -1 if offset[0] == '-' else 1
+    return datetime.timezone(sign * datetime.timedelta(
+        hours=int(offset[1:3]), minutes=int(offset[4:6])
+    ))
+
+
+def _split(value):
+    """
+    Split value into its local time and its offset ('' if naive).
+    """
+    match = _OFFSET.search(value)
+    if match is None:
+        return value, ''
+    return value[:match.start()], match.group()
+
+
+def is_timestamp(value):
+    return _TIMESTAMP.fullmatch(value) is not None
+
+
+def parse_time(value):
+    """
+    Parse a single timestamp to an aware datetime in UTC, None for the
+    nulls and the placeholder dates.
+    """
+    if not value:
+        return None
+    local, offset = _split(value)
+    if int(local[:4]) < MIN_YEAR:
+        return None
+    # datetime only supports up to microseconds
+    head, dot, fraction = local.partition('.')
+    if len(fraction) > 6:
+        local = head + dot + fraction[:6]
+    parsed = datetime.datetime.fromisoformat(local)
+    return parsed.replace(tzinfo=_timezone(offset)).astimezone(
+        datetime.timezone.utc
+    )
+
+
+def _suffix(suffix):
+    try:
+        return _suffixes[suffix]
+    except KeyError:
+        pass
+    offset = _split(suffix)[1]
+    tz = _timezone(offset).utcoffset(None)
+    info = (len(offset), tz // datetime.timedelta(microseconds=1) * 1000)
+    if offset:
+        # the naive suffixes are just the end of the time, don't keep them
+        _suffixes[suffix] = info
+    return info
+
+
+def _days_from_civil(year, month, day):
+    # days since 1970-01-01 of the proleptic gregorian dates, see
+    # http://howardhinnant.github.io/date_algorithms.html#days_from_civil
+    year = year - (month <= 2)
+    era = year // 400
+    year_of_era = year - era * 400
+    shifted_month = month + np.where(month > 2, -3, 9)
+    day_of_year = (153 * shifted_month + 2) // 5 + day - 1
+    day_of_era = (year_of_era * 365 + year_of_era // 4 - year_of_era // 100
+                  + day_of_year)
+    return era * 146097 + day_of_era - 719468
+
+
+def _number(digits, start, stop):
+    value = np.zeros(len(digits), dtype=np.int64)
+    for position in range(start, stop):
+        value = value * 10 + digits[:, position]
+    return value
+
+
+def parse_times(values):
+    """
+    Parse the timestamps of values (a sequence of str or None) to a
+    datetime64[ns] array in UTC.
+    """
+    _require_numpy()
+    # the timestamps are ASCII, each row of codes are the bytes of a string
+    # padded with 0, with room for the date, the time and 9 digits of
+    # fraction
+    # (None is converted to b'None')
+    text = np.array(values, dtype=bytes)
+    if not text.size:
+        return np.empty(0, dtype='datetime64[ns]')
+    codes = text.view(np.uint8).reshape(len(text), -1)
+    if codes.shape[1] < len(_LAYOUT) + 10:
+        padding = len(_LAYOUT) + 10 - codes.shape[1]
+        codes = np.pad(codes, ((0, 0), (0, padding)))
+    lengths = np.count_nonzero(codes, axis=1)
+
+    # the suffixes are packed in an int to find the distinct ones
+    positions = np.maximum(lengths[:, None] + np.arange(-6, 0), 0)
+    suffixes = np.take_along_axis(codes, positions, axis=1)
+    keys = (suffixes.astype(np.int64) << np.arange(0, 48, 8)).sum(axis=1)
+    uniques, first, inverse = np.unique(
+        keys, return_index=True, return_inverse=True
+    )
+    info = np.array([
+        _suffix(suffixes[index].tobytes().decode()) for index in first
+    ], dtype=np.int64).reshape(-1, 2)
+    strip, offsets = info[inverse.ravel()].T
+    local_lengths = lengths - strip
+
+    # the fields are at fixed positions: YYYY-MM-DDTHH:MM:SS[.fffffffff]
+    digits = codes[:, :len(_LAYOUT) + 10].astype(np.int64) - ord('0')
+    separators = np.array([ord(char) for char in _LAYOUT])
+    is_separator = separators != ord('d')
+    well_formed = (
+        (codes[:, :len(_LAYOUT)][:, is_separator] == separators[is_separator])
+        .all(axis=1)
+        & ((local_lengths == len(_LAYOUT))
+           | ((local_lengths > len(_LAYOUT) + 1)
+              & (local_lengths <= len(_LAYOUT) + 10)
+              & (codes[:, len(_LAYOUT)] == ord('.'))))
+    )
+    years = _number(digits, 0, 4)
+    seconds = (
+        _days_from_civil(years, _number(digits, 5, 7), _number(digits, 8, 10))
+        * 86400
+        + _number(digits, 11, 13) * 3600
+        + _number(digits, 14, 16) * 60
+        + _number(digits, 17, 19)
+    )
+    fraction_digits = np.where(
+        np.arange(20, 29) < local_lengths[:, None], digits[:, 20:29], 0
+    )
+    fraction = _number(fraction_digits, 0, 9)
+    result = (seconds * 1_000_000_000 + fraction - offsets).view(
+        'datetime64[ns]'
+    )
+    missing = (lengths == 0) | (text == b'None')
+    result[missing | (years < MIN_YEAR)] = np.datetime64('NaT')
+
+    # anything else is left to the slow path, e.g. the dates without time
+    for index in np.flatnonzero(~well_formed & ~missing):
+        parsed = parse_time(text[index].decode())
+        result[index] = np.datetime64(
+            'NaT' if parsed is None else parsed.replace(tzinfo=None), 'ns'
+        )
+    return result
+
+
+def parse_epoch(values, unit='ns'):
+    """
+    Same as parse_times but as int64 from the epoch in unit, the missing
+    values are the minimum int64 (the value of NaT).
+    """
+    return parse_times(values).astype('datetime64[{}]'.format(unit)).view(
+        np.int64
+    )
+
+
+def to_datetimes(values):
+    """
+    Parse the timestamps of values to a list of aware datetimes in UTC,
+    vectorized when numpy is available.
+    """
+    try:
+        _require_numpy()
+    except GBMException:
+        return [parse_time(value) for value in values]
+    utc = datetime.timezone.utc
+    return [
+        None if value is None else value.replace(tzinfo=utc)
+        for value in parse_times(values).astype('datetime64[us]').tolist()
+    ]
@@ -0,0 +1,526 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+import requests.adapters
+
+import gbm.urls
+from gbm.base_request import get_driver
+from gbm.exceptions import GBMException
+from gbm.utilities import get_preferences_dir
+
+logger = logging.getLogger(__name__)
+
+# fragments of the Incapsula interstitial page, if any of them is on the
+# body of a non JSON response the server is challenging the client again
+CHALLENGE_MARKERS = (
+    b'_Incapsula_Resource',
+    b'Incapsula incident',
+    b'Request unsuccessful. Incapsula',
+)
+
+# the anti-bot session cookies don't have an expiry, consider them
+# expired after this many seconds since they were harvested
+SESSION_COOKIE_MAX_AGE = 30 * 60
+
+# http2 in httpx depends on the h2 package
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+@dataclass
+class HostLimits:
+    """
+    Limits of the connection pool of a single host.
+
+    max_connections is the size of the keep-alive pool and max_in_flight
+    the number of concurrent requests allowed, the rest of the callers
+    wait for a free slot. http2 is only used by the async transport and
+    when the h2 package is installed.
+    """
+    max_connections: int = 10
+    max_in_flight: int = 10
+    http2: bool = True
+
+
+def default_limits(**overrides):
+    """
+    Return the limits for every host in gbm.urls.HOSTS, the overrides
+    are HostLimits keyed by host, e.g.:
+    default_limits(**{gbm.urls.AUTH_BASE_URL: HostLimits(2, 2)})
+    """
+    limits = {host: HostLimits() for host in gbm.urls.HOSTS}
+    limits.update(overrides)
+    return limits
+
+
+def is_challenge(rsp):
+    """
+    Return True if the response is the anti-bot challenge page instead of
+    the response of the API.
+    """
+    content_type = rsp.headers.get('Content-Type', '')
+    if 'json' in content_type:
+        return False
+    head = rsp.content[:4096]
+    return any(marker in head for marker in CHALLENGE_MARKERS)
+
+
+def harvest_cookies(driver, reload_page=True):
+    """
+    Return the cookies and the user agent of the driver, if reload_page
+    is True load the sign in form first to get a fresh set of cookies.
+    """
+    if reload_page:
+        driver.get(gbm.urls.SIGNIN_FORM_URL)
+    user_agent = driver.execute_script("return navigator.userAgent")
+    return driver.get_cookies(), user_agent
+
+
+def cookie_jar_path():
+    return os.path.join(get_preferences_dir(), 'anti_bot_cookies.json')
+
+
+def save_cookies(cookies, user_agent):
+    """
+    Save the harvested cookies and user agent in the preferences dir.
+    """
+    with open(cookie_jar_path(), 'w') as jar_file:
+        json.dump({
+            'cookies': cookies,
+            'user_agent': user_agent,
+            'saved_at': time.time()
+        }, jar_file)
+
+
+def load_cookies():
+    """
+    Return the saved cookies and user agent, without the expired cookies.
+
+    Return None if there is no saved jar or if all the cookies expired.
+    """
+    try:
+        with open(cookie_jar_path()) as jar_file:
+            jar = json.load(jar_file)
+    except (FileNotFoundError, ValueError):
+        return None
+    now = time.time()
+    session_expiry = jar['saved_at'] + SESSION_COOKIE_MAX_AGE
+    cookies = [
+        cookie for cookie in jar['cookies']
+        if cookie.get('expiry', session_expiry) > now
+    ]
+    if not cookies:
+        return None
+    return cookies, jar['user_agent']
+
+
+def pooled_session(limits=None):
+    """
+    Return a requests.Session with a separate keep-alive pool for each
+    one of the hosts in limits.
+    """
+    if limits is None:
+        limits = default_limits()
+    http = requests.Session()
+    for host, host_limits in limits.items():
+        http.mount(host, requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=host_limits.max_connections,
+            pool_block=True
+        ))
+    return http
+
+
+class HostStats:
+    """
+    Counters of the requests made to a single host.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.in_flight = 0
+        self.waiters = 0
+        self.new_connections = 0
+
+    def as_dict(self, open_connections):
+        if self.requests:
+            reuse_ratio = 1 - min(self.new_connections, self.requests) / (
+                self.requests
+            )
+        else:
+            reuse_ratio = 0.0
+        return {
+            'open_connections': open_connections,
+            'new_connections': self.new_connections,
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'waiters': self.waiters,
+            'reuse_ratio': reuse_ratio,
+        }
+
+
+class _HostGate:
+    """
+    Cap the number of in-flight requests to a host from several threads.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.stats = HostStats()
+        self._semaphore = threading.BoundedSemaphore(limits.max_in_flight)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        with self._lock:
+            self.stats.waiters += 1
+        self._semaphore.acquire()
+        with self._lock:
+            self.stats.waiters -= 1
+            self.stats.in_flight += 1
+            self.stats.requests += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self._lock:
+            self.stats.in_flight -= 1
+        self._semaphore.release()
+
+
+class _AsyncHostGate:
+    """
+    Same as _HostGate but for the tasks of an event loop.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.stats = HostStats()
+        self._semaphore = asyncio.Semaphore(limits.max_in_flight)
+
+    async def __aenter__(self):
+        self.stats.waiters += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.stats.waiters -= 1
+        self.stats.in_flight += 1
+        self.stats.requests += 1
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.stats.in_flight -= 1
+        self._semaphore.release()
+
+    async def trace(self, event, info):
+        # httpx/httpcore trace extension, called for every step of the
+        # connection, only the new tcp connections are relevant
+        if event.endswith('connect_tcp.complete'):
+            self.stats.new_connections += 1
+
+
+class PooledSession:
+    """
+    A pooled_session that caps the in-flight requests of each host with
+    HostLimits.max_in_flight and counts them, see pool_stats.
+
+    It doesn't deal with the anti-bot cookies, HTTPTransport does, it's
+    used as is by the hosts that don't challenge the client.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = default_limits() if limits is None else limits
+        self.http = pooled_session(self.limits)
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def _gate(self, url):
+        host = gbm.urls.host_of(url)
+        with self._lock:
+            if host not in self._gates:
+                limits = self.limits.get(host, HostLimits())
+                self._gates[host] = _HostGate(limits)
+            return self._gates[host]
+
+    def request(self, method, url, **kwargs):
+        with self._gate(url):
+            return self.http.request(method, url, **kwargs)
+
+    def pool_stats(self):
+        """
+        Return the stats of the connection pool of each host used so far.
+        """
+        stats = {}
+        for host, gate in list(self._gates.items()):
+            adapter = self.http.get_adapter(host)
+            open_connections = 0
+            gate.stats.new_connections = 0
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools[key]
+                gate.stats.new_connections += pool.num_connections
+                open_connections += sum(
+                    1 for conn in list(pool.pool.queue) if conn is not None
+                )
+            stats[host] = gate.stats.as_dict(
+                open_connections + gate.stats.in_flight
+            )
+        return stats
+
+    def close(self):
+        self.http.close()
+
+
+class HTTPTransport:
+    """
+    Drop-in replacement of the selenium driver for the API classes.
+
+    The driver is only used to load the sign in form and harvest the
+    anti-bot cookies and the user agent of the browser, all the API calls
+    are made with a plain ``requests.Session`` that keeps a separate
+    keep-alive pool for each host, see HostLimits.
+
+    If the server challenges a request, the cookies are harvested again
+    and the request retried, if the server keeps challenging the client
+    the request is made through the driver itself.
+
+    If persist_cookies is True the harvested cookies are saved in the
+    preferences dir and reused by the next transport while they are not
+    expired or rejected, without starting the driver at all.
+    """
+
+    def __init__(self, driver_factory=get_driver, max_retries=1,
+                 limits=None, persist_cookies=True):
+        self.max_retries = max_retries
+        self.persist_cookies = persist_cookies
+        self.limits = default_limits() if limits is None else limits
+        self._driver_factory = driver_factory
+        self._pool = PooledSession(self.limits)
+        self._http = self._pool.http
+        self._lock = threading.Lock()
+        # incremented on every harvest, it is used to avoid harvesting
+        # multiple times when several threads get challenged at once
+        self._generation = 0
+        # the saved cookies don't need a driver, if they are rejected the
+        # driver is started and its warm up already loads the sign in form
+        self._driver_used = False
+
+    @property
+    def driver(self):
+        return self._driver_factory()
+
+    def harvest(self, reload_page=True):
+        """
+        Copy the cookies and the user agent of the driver into the
+        http session, if reload_page is True load the sign in form first
+        to get a fresh set of cookies.
+        """
+        with self._lock:
+            self._harvest(reload_page)
+            return self._generation
+
+    def _harvest(self, reload_page):
+        cookies, user_agent = harvest_cookies(self.driver, reload_page)
+        self._driver_used = True
+        if self.persist_cookies:
+            save_cookies(cookies, user_agent)
+        self._set_cookies(cookies, user_agent)
+        logger.debug("Harvested %d cookies from the driver", len(cookies))
+
+    def _set_cookies(self, cookies, user_agent):
+        for cookie in cookies:
+            self._http.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie.get('domain'),
+                path=cookie.get('path', '/'),
+                secure=cookie.get('secure', False),
+                expires=cookie.get('expiry')
+            )
+        self._http.headers['User-Agent'] = user_agent
+        self._generation += 1
+
+    def _ensure_cookies(self):
+        with self._lock:
+            if not self._generation:
+                saved = load_cookies() if self.persist_cookies else None
+                if saved is not None:
+                    logger.debug("Using the saved anti-bot cookies")
+                    self._set_cookies(*saved)
+                else:
+                    # get_driver already loads the sign in form
+                    self._harvest(reload_page=False)
+            return self._generation
+
+    def _reharvest(self, generation):
+        with self._lock:
+            if generation == self._generation:
+                self._harvest(reload_page=self._driver_used)
+
+    def request(self, method, url, **kwargs):
+        for _ in range(self.max_retries + 1):
+            generation = self._ensure_cookies()
+            rsp = self._pool.request(method, url, **kwargs)
+            if not is_challenge(rsp):
+                return rsp
+            logger.info("Anti-bot challenge on %s, harvesting the cookies",
+                        url)
+            self._reharvest(generation)
+        logger.warning("Still challenged on %s, using the driver", url)
+        return self.driver.request(method, url, **kwargs)
+
+    def pool_stats(self):
+        """
+        Return the stats of the connection pool of each host used so far.
+        """
+        return self._pool.pool_stats()
+
+    def close(self):
+        self._pool.close()
+
+
+class AsyncHTTPTransport:
+    """
+    Asyncio version of HTTPTransport built on top of ``httpx.AsyncClient``,
+    with a client per host to multiplex the requests over http2 when
+    available.
+
+    The driver is still a blocking selenium driver, it is started and
+    used from a worker thread to avoid blocking the event loop.
+    """
+
+    def __init__(self, driver_factory=get_driver, max_retries=1,
+                 limits=None, persist_cookies=True):
+        # httpx is only imported by the async transport, not with gbm
+        try:
+            import httpx
+        except ImportError:
+            raise GBMException(
+                "The async transport requires httpx, "
+                "install the 'async' extra."
+            ) from None
+        self._httpx = httpx
+        self.max_retries = max_retries
+        self.persist_cookies = persist_cookies
+        self.limits = default_limits() if limits is None else limits
+        self._driver_factory = driver_factory
+        self._clients = {}
+        self._transports = {}
+        self._gates = {}
+        self._cookies = []
+        self._user_agent = None
+        self._lock = asyncio.Lock()
+        self._generation = 0
+        self._driver_used = False
+
+    def _harvest_in_thread(self, reload_page):
+        cookies, user_agent = harvest_cookies(
+            self._driver_factory(), reload_page
+        )
+        self._driver_used = True
+        if self.persist_cookies:
+            save_cookies(cookies, user_agent)
+        return cookies, user_agent
+
+    def _set_cookies(self, client):
+        for cookie in self._cookies:
+            client.cookies.set(
+                cookie['name'],
+                cookie['value'],
+                domain=cookie.get('domain', ''),
+                path=cookie.get('path', '/')
+            )
+        client.headers['User-Agent'] = self._user_agent
+
+    async def _harvest(self, reload_page):
+        self._use_cookies(*await asyncio.to_thread(
+            self._harvest_in_thread, reload_page
+        ))
+
+    def _use_cookies(self, cookies, user_agent):
+        self._cookies, self._user_agent = cookies, user_agent
+        for client in self._clients.values():
+            self._set_cookies(client)
+        self._generation += 1
+
+    async def harvest(self, reload_page=True):
+        async with self._lock:
+            await self._harvest(reload_page)
+            return self._generation
+
+    async def _ensure_cookies(self):
+        async with self._lock:
+            if not self._generation:
+                saved = load_cookies() if self.persist_cookies else None
+                if saved is not None:
+                    logger.debug("Using the saved anti-bot cookies")
+                    self._use_cookies(*saved)
+                else:
+                    await self._harvest(reload_page=False)
+            return self._generation
+
+    async def _reharvest(self, generation):
+        async with self._lock:
+            if generation == self._generation:
+                await self._harvest(reload_page=self._driver_used)
+
+    def _client(self, url):
+        host = gbm.urls.host_of(url)
+        if host not in self._clients:
+            limits = self.limits.get(host, HostLimits())
+            httpx = self._httpx
+            self._transports[host] = httpx.AsyncHTTPTransport(
+                http2=limits.http2 and HTTP2_AVAILABLE,
+                limits=httpx.Limits(
+                    max_connections=limits.max_connections,
+                    max_keepalive_connections=limits.max_connections
+                )
+            )
+            self._clients[host] = httpx.AsyncClient(
+                transport=self._transports[host]
+            )
+            self._set_cookies(self._clients[host])
+            self._gates[host] = _AsyncHostGate(limits)
+        return self._clients[host], self._gates[host]
+
+    async def request(self, method, url, stream=False, **kwargs):
+        for _ in range(self.max_retries + 1):
+            generation = await self._ensure_cookies()
+            client, gate = self._client(url)
+            request = client.build_request(
+                method, url, extensions={'trace': gate.trace}, **kwargs
+            )
+            async with gate:
+                rsp = await client.send(request, stream=stream)
+            if stream and 'json' not in rsp.headers.get('Content-Type', ''):
+                # is_challenge needs the body
+                await rsp.aread()
+            if not is_challenge(rsp):
+                return rsp
+            logger.info("Anti-bot challenge on %s, harvesting the cookies",
+                        url)
+            await self._reharvest(generation)
+        logger.warning("Still challenged on %s, using the driver", url)
+        return await asyncio.to_thread(
+            self._driver_factory().request, method, url, **kwargs
+        )
+
+    def pool_stats(self):
+        """
+        Return the stats of the connection pool of each host used so far.
+        """
+        stats = {}
+        for host, gate in self._gates.items():
+            # httpx doesn't expose the httpcore pool of the transport
+            pool = getattr(self._transports[host], '_pool', None)
+            open_connections = len(getattr(pool, 'connections', ()))
+            stats[host] = gate.stats.as_dict(open_connections)
+        return stats
+
+    async def aclose(self):
+        for client in self._clients.values():
+            await client.aclose()
@@ -0,0 +1,254 @@
+"""
+Local store of the daily bars of Market.capital_market_historic_price.
+
+Every instrument has a directory under the preferences dir with a flat
+binary file per column of gbm.columnar.BARS, sorted by date, and a
+meta.json with the number of rows and the date ranges already fetched.
+A query only fetches the ranges that were never fetched before and the
+result are memory-mapped views of the column files, so the repeated runs
+over the same instruments don't touch the network nor copy the data.
+
+The days that are not over yet are never marked as fetched, their bars
+are fetched again and replace the stored ones.
+
+The store is safe to use from several threads, but there should be a
+single process writing to it.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import urllib.parse
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import gbm.columnar
+from gbm.exceptions import GBMException
+from gbm.utilities import get_preferences_dir
+
+logger = logging.getLogger(__name__)
+
+
+def store_dir():
+    return os.path.join(get_preferences_dir(), 'historic')
+
+
+def _day(value):
+    """
+    The value (a date, datetime or ISO string) as a datetime64[D].
+    """
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return np.datetime64(value, 'D')
+
+
+def merge_ranges(ranges):
+    """
+    Merge the overlapping or adjacent (start, end) ranges of days, both
+    ends included.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + np.timedelta64(1, 'D'):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def missing_ranges(covered, start, end):
+    """
+    The ranges of days between start and end (included) that are not in
+    the merged ranges of covered.
+    """
+    missing = []
+    for covered_start, covered_end in covered:
+        if covered_end < start:
+            continue
+        if covered_start > end:
+            break
+        if covered_start > start:
+            missing.append((start, covered_start - np.timedelta64(1, 'D')))
+        start = covered_end + np.timedelta64(1, 'D')
+    if start <= end:
+        missing.append((start, end))
+    return missing
+
+
+class _Series:
+    """
+    The column files and the metadata of an instrument.
+    """
+
+    def __init__(self, directory, schema):
+        self.directory = directory
+        self.schema = schema
+        self.rows = 0
+        self.covered = []
+        try:
+            with open(self._path('meta.json')) as meta_file:
+                meta = json.load(meta_file)
+        except FileNotFoundError:
+            return
+        self.rows = meta['rows']
+        self.covered = [
+            (np.datetime64(start, 'D'), np.datetime64(end, 'D'))
+            for start, end in meta['covered']
+        ]
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _column_path(self, column):
+        return self._path(column.name + '.bin')
+
+    def _dtype(self, column):
+        return gbm.columnar.kind_dtype(column.kind)
+
+    def columns(self):
+        """
+        Memory-mapped arrays of the columns, read-only.
+        """
+        if not self.rows:
+            return {column.name: np.empty(0, dtype=self._dtype(column))
+                    for column in self.schema}
+        return {
+            column.name: np.memmap(
+                self._column_path(column), dtype=self._dtype(column),
+                mode='r', shape=(self.rows,)
+            )
+            for column in self.schema
+        }
+
+    def _write_meta(self):
+        meta = {
+            'rows': self.rows,
+            'covered': [[str(start), str(end)] for start, end in self.covered],
+        }
+        tmp_path = self._path('meta.json.tmp')
+        with open(tmp_path, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_path, self._path('meta.json'))
+
+    def save(self, new, covered):
+        """
+        Merge the columns of new, the bars of the ranges covered.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        dates = new['date']
+        old = self.columns()
+        if not len(dates) or not self.rows or dates.min() > old['date'][-1]:
+            # the common case, the bars after the last stored one
+            order = np.argsort(dates, kind='stable')
+            for column in self.schema:
+                with open(self._column_path(column), 'r+b' if self.rows
+                          else 'wb') as column_file:
+                    column_file.truncate(
+                        self.rows * np.dtype(self._dtype(column)).itemsize
+                    )
+                    column_file.seek(0, os.SEEK_END)
+                    column_file.write(new[column.name][order].tobytes())
+            self.rows += len(dates)
+        else:
+            merged = {name: np.concatenate([old[name], new[name]])
+                      for name in new}
+            # the new bars come last, and the last of each date is kept
+            order = np.argsort(merged['date'], kind='stable')
+            sorted_dates = merged['date'][order]
+            keep = np.append(sorted_dates[1:] != sorted_dates[:-1], True)
+            order = order[keep]
+            for column in self.schema:
+                tmp_path = self._column_path(column) + '.tmp'
+                merged[column.name][order].tofile(tmp_path)
+                os.replace(tmp_path, self._column_path(column))
+            self.rows = len(order)
+        self.covered = merge_ranges(self.covered + covered)
+        self._write_meta()
+
+
+class HistoricStore:
+    """
+    Daily bars of the instruments, fetched with market (a
+    gbm.old_digital_api.api.Market) and kept on the local directory path.
+    """
+
+    def __init__(self, market, path=None):
+        if np is None:
+            raise GBMException(
+                "The historic store requires numpy, install the 'numpy' extra."
+            )
+        self.market = market
+        self.path = store_dir() if path is None else path
+        self.schema = gbm.columnar.BARS
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def _directory(self, issue_id, instrument_type):
+        instrument_type = getattr(instrument_type, 'value', instrument_type)
+        return os.path.join(
+            self.path, str(instrument_type),
+            urllib.parse.quote(issue_id, safe='')
+        )
+
+    def _series_lock(self, directory):
+        with self._lock:
+            return self._locks.setdefault(directory, threading.Lock())
+
+    def _fetch(self, issue_id, instrument_type, start, end):
+        logger.debug("Fetching the bars of %s from %s to %s",
+                     issue_id, start, end)
+        return self.market.capital_market_historic_price(
+            issue_id, instrument_type,
+            '{}T00:00:00'.format(start), '{}T23:59:59'.format(end),
+            output=gbm.columnar.COLUMNS
+        )
+
+    def missing(self, issue_id, instrument_type, start, end):
+        """
+        The ranges of days between start and end that are not stored yet.
+        """
+        series = _Series(self._directory(issue_id, instrument_type),
+                         self.schema)
+        return missing_ranges(series.covered, _day(start), _day(end))
+
+    def bars(self, issue_id, instrument_type, start, end):
+        """
+        Dict of the columns of gbm.columnar.BARS with the daily bars between
+        the days start and end (included), fetching the missing ranges.
+
+        The arrays are read-only views of the memory-mapped files.
+        """
+        start, end = _day(start), _day(end)
+        directory = self._directory(issue_id, instrument_type)
+        with self._series_lock(directory):
+            series = _Series(directory, self.schema)
+            missing = missing_ranges(series.covered, start, end)
+            if missing:
+                fetched = [
+                    self._fetch(issue_id, instrument_type, *days)
+                    for days in missing
+                ]
+                new = {
+                    column.name: np.concatenate(
+                        [bars[column.name] for bars in fetched]
+                    )
+                    for column in self.schema
+                }
+                valid = ~np.isnat(new['date'])
+                new = {name: column[valid] for name, column in new.items()}
+                # the bars of today can still change
+                today = np.datetime64(datetime.date.today(), 'D')
+                covered = [
+                    (first, min(last, today - np.timedelta64(1, 'D')))
+                    for first, last in missing if first < today
+                ]
+                series.save(new, covered)
+            columns = series.columns()
+        first, last = np.searchsorted(columns['date'], np.array(
+            [start, end + np.timedelta64(1, 'D')], dtype='datetime64[ns]'
+        ))
+        return {name: column[first:last] for name, column in columns.items()}
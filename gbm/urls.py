@@ -1,3 +1,5 @@
+import urllib.parse
+
 from gbm.constants import HBPRO_CLIENT_ID
 
 API_V1_BASE_URL = "https://api.gbm.com/v1"
@@ -5,10 +7,28 @@ API_V2_BASE_URL = "https://api.gbm.com/v2"
 API_GBMP_BASE_URL = "https://homebroker-api.gbm.com/GBMP/api"
 AUTH_API_V1_BASE_URL = "https://auth.gbm.com/api/v1"
 AUTH_BASE_URL = "https://auth.gbm.com"
+OLD_API_BASE_URL = "https://www.gbmhomebroker.com"
 SIGNIN_FORM_URL = AUTH_BASE_URL + (
     "/signin?client_id={}" .format(HBPRO_CLIENT_ID)
 )
 
+# every host used by the apis, each one gets its own connection pool
+HOSTS = (
+    "https://api.gbm.com",
+    "https://homebroker-api.gbm.com",
+    AUTH_BASE_URL,
+    OLD_API_BASE_URL,
+)
+
+
+def host_of(url):
+    """
+    Return the scheme and network location of the url, used as the key
+    of the connection pools.
+    """
+    parts = urllib.parse.urlsplit(url)
+    return "{}://{}".format(parts.scheme, parts.netloc)
+
 
 def auth_api_v1_url(url_segment):
     return "{}{}".format(AUTH_API_V1_BASE_URL, url_segment)
@@ -1,4 +1,6 @@
+import contextlib
 import os
+import time
 
 
 def get_preferences_dir(make_dir=True):
@@ -14,3 +16,34 @@ def get_preferences_dir(make_dir=True):
     if make_dir and not os.path.exists(directory):
         os.mkdir(directory)
     return directory
+
+
+class Timings:
+    """
+    Time spent on each one of the phases of a process, in seconds.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[phase] = time.perf_counter() - start
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+    def __repr__(self):
+        return "<Timings {}>".format(", ".join(
+            "{}: {:.3f}s".format(phase, seconds)
+            for phase, seconds in self.phases.items()
+        ))
+
+
+# breakdown of the startup of the module: api_init and the driver
+startup_timings = Timings()
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from gbm.auth import AsyncSessionRefresher, Session, SessionRefresher
+
+TOKENS = {
+    'accessToken': 'access', 'identityToken': 'identity',
+    'refreshToken': 'refresh', 'tokenType': 'Bearer', 'expiresIn': 3600
+}
+
+
+class FakeAuthAPI:
+    """
+    An AuthAPIv1 whose token(refresh=True) returns the next access token,
+    or raises the exceptions of failures first.
+    """
+
+    def __init__(self, session, failures=(), expires_in=3600):
+        self.session = session
+        self.failures = list(failures)
+        self.expires_in = expires_in
+        self.headers = []
+        self.renewed = threading.Event()
+
+    def token(self, refresh=False):
+        assert refresh
+        self.headers.append(self.session.auth_refresh_header)
+        if self.failures:
+            raise self.failures.pop(0)
+        self.renewed.set()
+        # the renewals don't include the refresh token
+        return {'accessToken': 'access{}'.format(len(self.headers)),
+                'tokenType': 'Bearer', 'expiresIn': self.expires_in}
+
+
+class AsyncFakeAuthAPI(FakeAuthAPI):
+
+    async def token(self, refresh=False):
+        return super().token(refresh)
+
+
+def test_renew_keeps_the_tokens_not_included():
+    session = Session('user', TOKENS, start_time=0)
+    assert session.expired
+    session.renew({'accessToken': 'new', 'tokenType': 'Bearer',
+                   'expiresIn': 60})
+    assert session.auth_access_header == 'Bearer new'
+    assert session.auth_refresh_header == 'Bearer refresh'
+    assert session.identity_token == 'identity'
+    assert session.expires_in == 60
+    assert not session.expired
+    with pytest.raises(Exception):
+        session.renew({'tokenType': 'MAC'})
+
+
+def test_the_renewed_session_is_saved(tmp_path, monkeypatch):
+    monkeypatch.setenv('GBM_PREFERENCES_DIR', str(tmp_path))
+    auth_api = FakeAuthAPI(Session('user', TOKENS))
+    SessionRefresher(auth_api).refresh()
+    assert auth_api.headers == ['Bearer refresh']
+    saved = Session.from_saved_session('user')
+    assert saved.access_token == 'access1'
+    assert saved.refresh_token == 'refresh'
+
+
+def test_next_refresh():
+    session = Session('user', TOKENS, start_time=time.time() - 1800)
+    refresher = SessionRefresher(FakeAuthAPI(session), fraction=0.75)
+    assert refresher.next_refresh() == pytest.approx(900, abs=1)
+    session.start_time -= 3600
+    assert refresher.next_refresh() == 0
+
+
+def test_the_refresher_retries_the_failed_renewals():
+    # due right away, the renewed token is due in 2700 seconds
+    session = Session('user', TOKENS, start_time=time.time() - 3600)
+    auth_api = FakeAuthAPI(session, [RuntimeError("timeout")] * 2)
+    refresher = SessionRefresher(auth_api, retry_interval=0.01, save=False)
+    refresher.start()
+    assert auth_api.renewed.wait(5)
+    refresher.stop()
+    assert len(auth_api.headers) == 3
+    assert session.access_token == 'access3'
+    assert refresher.next_refresh() == pytest.approx(2700, abs=1)
+
+
+def test_the_async_refresher_retries_the_failed_renewals():
+    session = Session('user', TOKENS, start_time=time.time() - 3600)
+    auth_api = AsyncFakeAuthAPI(session, [RuntimeError("timeout")])
+    refresher = AsyncSessionRefresher(auth_api, retry_interval=0.01,
+                                      save=False)
+
+    async def run():
+        refresher.start()
+        # the renewed tokens are swapped in after the request
+        while session.access_token == 'access':
+            await asyncio.sleep(0.01)
+        await refresher.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 5))
+    assert len(auth_api.headers) == 2
+    assert session.access_token == 'access2'
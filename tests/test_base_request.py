@@ -0,0 +1,152 @@
+import queue
+import threading
+import time
+
+import pytest
+
+import gbm
+from gbm.base_request import DriverPool, LazyDriver
+from gbm.utilities import Timings, startup_timings
+
+
+class FakeDriver:
+
+    def __init__(self, number):
+        self.number = number
+        self.alive = True
+        self.quits = 0
+
+    @property
+    def current_url(self):
+        if not self.alive:
+            import selenium.common.exceptions
+            raise selenium.common.exceptions.WebDriverException("crashed")
+        return 'about:blank'
+
+    def request(self, method, url, **kwargs):
+        return (self.number, method, url)
+
+    def quit(self):
+        self.quits += 1
+
+
+class Factory:
+
+    def __init__(self):
+        self.drivers = []
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            driver = FakeDriver(len(self.drivers))
+            self.drivers.append(driver)
+            return driver
+
+
+def test_checkout_and_checkin():
+    factory = Factory()
+    pool = DriverPool(2, factory)
+    first = pool.checkout()
+    second = pool.checkout()
+    assert len(factory.drivers) == 2
+    assert first is not second
+    pool.checkin(first)
+    assert pool.request('GET', 'url') == (first.number, 'GET', 'url')
+    assert pool.checkout() is first
+    pool.close()
+
+
+def test_checkout_waits_for_a_free_driver():
+    pool = DriverPool(1, Factory())
+    with pool.driver():
+        with pytest.raises(queue.Empty):
+            pool.checkout(timeout=0.05)
+    pool.checkout(timeout=0.05)
+    pool.close()
+
+
+def test_dead_drivers_are_recycled():
+    pytest.importorskip('selenium')
+    factory = Factory()
+    pool = DriverPool(1, factory)
+    pool.start()
+    dead = factory.drivers[0]
+    dead.alive = False
+    driver = pool.checkout()
+    assert driver is factory.drivers[1]
+    assert dead.quits == 1
+    pool.checkin(driver)
+    pool.close()
+    assert driver.quits == 1
+
+
+def test_close_quits_the_checked_out_drivers():
+    factory = Factory()
+    pool = DriverPool(2, factory)
+    checked_out = pool.checkout()
+    pool.close()
+    assert [driver.quits for driver in factory.drivers] == [1, 1]
+    # returned after close, it's not quit twice
+    pool.checkin(checked_out)
+    assert checked_out.quits == 1
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+
+
+def test_lazy_driver_starts_on_the_first_request():
+    factory = Factory()
+    lazy = LazyDriver(factory)
+    assert not lazy.started and factory.drivers == []
+    assert lazy.request('GET', 'url') == (0, 'GET', 'url')
+    assert lazy.started
+    assert lazy() is factory.drivers[0]
+    assert lazy.number == 0
+    lazy.request('GET', 'url')
+    assert len(factory.drivers) == 1
+
+
+def test_lazy_driver_serializes_the_requests():
+    running, peak = [], []
+    lock = threading.Lock()
+
+    class SlowDriver(FakeDriver):
+        def request(self, method, url, **kwargs):
+            with lock:
+                running.append(url)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.remove(url)
+    lazy = LazyDriver(lambda: SlowDriver(0))
+    threads = [threading.Thread(target=lazy.request, args=('GET', str(n)))
+               for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 1
+
+
+def test_api_init_with_a_saved_session_starts_no_driver(tmp_path,
+                                                        monkeypatch):
+    monkeypatch.setenv('GBM_PREFERENCES_DIR', str(tmp_path))
+    gbm.auth.Session('user', {
+        'accessToken': 'access', 'identityToken': 'identity',
+        'refreshToken': 'refresh', 'tokenType': 'Bearer', 'expiresIn': 3600
+    }).save()
+    apis = gbm.api_init('user', load_session=True)
+    assert apis.session.access_token == 'access'
+    assert not apis.v1.driver.started
+    assert 'session' in startup_timings.phases
+
+
+def test_timings():
+    timings = Timings()
+    with timings.measure('first'):
+        time.sleep(0.01)
+    with pytest.raises(ValueError):
+        with timings.measure('second'):
+            raise ValueError()
+    assert set(timings.phases) == {'first', 'second'}
+    assert timings.total >= 0.01
+    assert 'first' in repr(timings)
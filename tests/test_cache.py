@@ -0,0 +1,126 @@
+import time
+
+import pytest
+
+from gbm.cache import (
+    NotModifiedMissing, ResponseCache, SQLiteCache, TieredCache,
+    ValidatorStore, make_key
+)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+def counting_fetch(value, size=10):
+    calls = []
+
+    def fetch():
+        calls.append(value)
+        return value, size
+    return fetch, calls
+
+
+def test_make_key_is_stable():
+    assert make_key('post', 'url', {'b': 1, 'a': 2}) == make_key(
+        'post', 'url', {'a': 2, 'b': 1}
+    )
+    assert make_key('post', 'url', None) != make_key('get', 'url', None)
+
+
+def test_fetch_caches_until_the_ttl():
+    cache = ResponseCache()
+    fetch, calls = counting_fetch([1, 2])
+    assert cache.fetch('key', fetch, ttl=60) == [1, 2]
+    assert cache.fetch('key', fetch, ttl=60) == [1, 2]
+    assert len(calls) == 1
+    assert cache.stats() == {'hits': 1, 'stale_hits': 0, 'misses': 1}
+
+
+def test_fetch_errors_are_not_cached():
+    cache = ResponseCache()
+
+    def failing():
+        raise RuntimeError("500")
+    with pytest.raises(RuntimeError):
+        cache.fetch('key', failing, ttl=60)
+    assert len(cache) == 0
+
+
+def test_expired_entries_are_fetched_again():
+    cache = ResponseCache()
+    cache.set('key', 'old', 1, ttl=0)
+    fetch, calls = counting_fetch('new')
+    assert cache.fetch('key', fetch, ttl=60) == 'new'
+    assert calls == ['new']
+
+
+def test_stale_entries_are_served_while_refreshed():
+    cache = ResponseCache()
+    cache.set('key', 'old', 1, ttl=0, stale_ttl=60)
+    fetch, calls = counting_fetch('new')
+    assert cache.fetch('key', fetch, ttl=60) == 'old'
+    deadline = time.monotonic() + 5
+    while cache.get('key') != ('new', True):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert calls == ['new']
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = ResponseCache(max_entries=2, max_bytes=100)
+    cache.set('a', 'a', 10, ttl=60)
+    cache.set('b', 'b', 10, ttl=60)
+    cache.get('a')
+    cache.set('c', 'c', 10, ttl=60)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    cache.set('big', 'big', 95, ttl=60)
+    assert len(cache) == 1
+    # bigger than the whole cache, never stored
+    cache.set('huge', 'huge', 101, ttl=60)
+    assert cache.get('huge') is None
+
+
+def test_tiered_cache_promotes_with_the_stored_size(tmp_path):
+    disk = SQLiteCache(str(tmp_path / 'cache.db'))
+    disk.set('key', {'a': 1}, 40, ttl=60)
+    memory = ResponseCache(max_bytes=100)
+    cache = TieredCache(memory, disk)
+    assert cache.get('key') == ({'a': 1}, True)
+    assert memory.get('key') == ({'a': 1}, True)
+    assert memory._bytes == 40
+
+
+def test_sqlite_cache_is_shared(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    SQLiteCache(path).set('key', [1, 2], 10, ttl=60)
+    assert SQLiteCache(path).get('key') == ([1, 2], True)
+
+
+def test_validators_skip_the_decoding_of_unchanged_bodies():
+    store = ValidatorStore()
+    decoded = []
+
+    def decode(rsp):
+        decoded.append(rsp.content)
+        return rsp.content.decode()
+    rsp = FakeResponse(content=b'body', headers={'ETag': '"v1"'})
+    assert store.resolve('key', rsp, decode) == 'body'
+    assert store.headers('key') == {'If-None-Match': '"v1"'}
+    assert store.resolve('key', FakeResponse(content=b'body'), decode) == (
+        'body'
+    )
+    assert store.resolve('key', FakeResponse(304), decode) == 'body'
+    assert decoded == [b'body']
+    assert (store.unchanged, store.not_modified) == (1, 1)
+
+
+def test_not_modified_without_a_stored_value():
+    store = ValidatorStore()
+    with pytest.raises(NotModifiedMissing):
+        store.resolve('key', FakeResponse(304), lambda rsp: None)
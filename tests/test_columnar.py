@@ -0,0 +1,59 @@
+import pytest
+
+import gbm.columnar
+from gbm.columnar import BARS, Column, convert, infer_schema, missing
+
+np = pytest.importorskip('numpy')
+
+ROWS = [
+    {'date': '2016-07-18T00:00:00-05:00', 'openPrice': 10, 'maxPrice': 12,
+     'minPrice': 9.5, 'closePrice': 11, 'percentageChange': 1.2,
+     'volume': 100},
+    {'date': None, 'openPrice': None, 'maxPrice': 13, 'minPrice': 10,
+     'closePrice': 12.5, 'percentageChange': None},
+]
+
+
+def test_columns_of_a_schema():
+    columns = convert(ROWS, gbm.columnar.COLUMNS, BARS)
+    assert list(columns) == [column.name for column in BARS]
+    assert columns['date'][0] == np.datetime64('2016-07-18T05:00:00', 'ns')
+    assert columns['close'].dtype == np.float64
+    assert columns['close'].tolist() == [11.0, 12.5]
+    assert missing(columns['date']).tolist() == [False, True]
+    assert missing(columns['open']).tolist() == [False, True]
+    assert missing(columns['volume']).tolist() == [False, True]
+
+
+def test_structured_array():
+    array = convert(ROWS, gbm.columnar.ARRAY, BARS)
+    assert array.dtype.names == tuple(column.name for column in BARS)
+    assert array['high'].tolist() == [12.0, 13.0]
+
+
+def test_infer_schema():
+    rows = [
+        {'date': '2016-08-10T14:59:32.183-05:00', 'name': None, 'ok': True},
+        {'date': None, 'name': 'AMXL', 'price': 1.5},
+    ]
+    assert infer_schema(rows) == (
+        Column('date', 'date', gbm.columnar.TIME),
+        Column('name', 'name', gbm.columnar.OBJECT),
+        Column('ok', 'ok', gbm.columnar.OBJECT),
+        Column('price', 'price', gbm.columnar.FLOAT),
+    )
+
+
+def test_object_columns_keep_the_lists():
+    rows = [{'tags': [1, 2]}, {'tags': [3, 4]}]
+    columns = convert(rows, gbm.columnar.COLUMNS)
+    assert columns['tags'].shape == (2,)
+    assert columns['tags'][1] == [3, 4]
+    assert missing(convert([{'tags': None}], 'columns')['tags']).tolist() == [
+        True
+    ]
+
+
+def test_unknown_output():
+    with pytest.raises(ValueError):
+        convert(ROWS, 'rows')
@@ -0,0 +1,87 @@
+import asyncio
+import itertools
+import threading
+import time
+
+import pytest
+
+from gbm.concurrency import AdaptiveSize, async_fan_out, fan_out, prefetched
+
+
+def test_fan_out_reports_each_result():
+    def func(key):
+        if key == 3:
+            raise ValueError(key)
+        return key * 2
+    results = {result.key: result for result in fan_out(func, range(5), 2)}
+    assert {key: result.value for key, result in results.items()
+            if result.error is None} == {0: 0, 1: 2, 2: 4, 4: 8}
+    assert isinstance(results[3].error, ValueError)
+
+
+def test_fan_out_caps_the_workers():
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def func(key):
+        with lock:
+            running.append(key)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(key)
+    list(fan_out(func, range(12), max_workers=3))
+    assert max(peak) <= 3
+
+
+def test_prefetched_keeps_the_order():
+    def func(key):
+        time.sleep(0.01 * (5 - key))
+        return key
+    assert list(prefetched(func, range(5), ahead=3)) == [0, 1, 2, 3, 4]
+
+
+def test_prefetched_takes_endless_keys():
+    values = prefetched(lambda key: key, itertools.count(), ahead=2)
+    assert list(itertools.islice(values, 4)) == [0, 1, 2, 3]
+
+
+def test_prefetched_raises_on_the_failed_value():
+    def func(key):
+        if key == 2:
+            raise ValueError(key)
+        return key
+    values = prefetched(func, range(4))
+    assert [next(values), next(values)] == [0, 1]
+    with pytest.raises(ValueError):
+        next(values)
+
+
+def test_async_fan_out():
+    async def func(key):
+        await asyncio.sleep(0)
+        if key == 1:
+            raise ValueError(key)
+        return key
+
+    async def collect():
+        return [result async for result in async_fan_out(func, range(3))]
+    results = {result.key: result for result in asyncio.run(collect())}
+    assert results[0].value == 0 and results[2].value == 2
+    assert isinstance(results[1].error, ValueError)
+
+
+def test_adaptive_size():
+    size = AdaptiveSize(100, 10, 1000, target=2.0)
+    # twice as fast as the target, the size doubles
+    size.observe(100, 1.0)
+    assert size.size == 200
+    # at most it doubles on every batch
+    size.observe(200, 0.01)
+    assert size.size == 400
+    size.failed()
+    assert size.size == 200
+    for _ in range(10):
+        size.failed()
+    assert size.size == 10
@@ -0,0 +1,58 @@
+import pytest
+
+from gbm.decoding import ArrayParser, iter_json_array
+
+
+def chunked(body, size):
+    return [body[pos:pos + size] for pos in range(0, len(body), size)]
+
+
+BODY = (
+    ' [{"name": "Peñoles", "price": 123.25, "active": true},'
+    ' {"name": "Café", "price": -1e3, "active": false, "tags": null},'
+    ' 42, "día", [1, [2]]] '
+).encode()
+
+ITEMS = [
+    {'name': 'Peñoles', 'price': 123.25, 'active': True},
+    {'name': 'Café', 'price': -1e3, 'active': False, 'tags': None},
+    42, 'día', [1, [2]],
+]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, len(BODY)])
+def test_items_split_across_chunks(size):
+    assert list(iter_json_array(chunked(BODY, size))) == ITEMS
+
+
+def test_items_are_returned_as_they_complete():
+    parser = ArrayParser()
+    assert parser.feed(b'[12') == []
+    # the number could continue on the next chunk
+    assert parser.feed(b'3') == []
+    assert parser.feed(b', tr') == [123]
+    assert parser.feed(b'ue, "\xc3') == [True]
+    assert parser.feed(b'\xb1"]') == ['ñ']
+    assert parser.feed(b'', final=True) == []
+
+
+@pytest.mark.parametrize('body', [b'[]', b' [ ] ', b'[\n]'])
+def test_empty_array(body):
+    assert list(iter_json_array(chunked(body, 1))) == []
+
+
+@pytest.mark.parametrize('body', [
+    b'[1,]',
+    b'[1 2]',
+    b'[1,,2]',
+    b'[1',
+    b'',
+    b'{"a": 1}',
+    b'"text"',
+    b'[1] garbage',
+    b'[1][2]',
+])
+def test_malformed_input(body):
+    for size in (1, len(body) or 1):
+        with pytest.raises(ValueError):
+            list(iter_json_array(chunked(body, size)))
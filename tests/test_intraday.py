@@ -0,0 +1,78 @@
+import pytest
+
+from gbm.intraday import IntradayTracker
+
+np = pytest.importorskip('numpy')
+
+
+def bars(minutes, closes):
+    return {
+        'date': np.array(['2023-03-01T10:{:02d}'.format(minute)
+                          for minute in minutes], dtype='datetime64[ns]'),
+        'close': np.array(closes, dtype=np.float64),
+    }
+
+
+def minutes(columns):
+    return [int(str(value)[14:16]) for value in columns['date']]
+
+
+def test_the_first_poll_is_all_new():
+    tracker = IntradayTracker(lambda instrument: None)
+    delta = tracker.update('AMXL', bars([0, 1, 2], [10, 11, 12]))
+    assert minutes(delta) == [0, 1, 2]
+    assert tracker.bars('AMXL')['close'].tolist() == [10, 11, 12]
+
+
+def test_revised_and_appended_bars():
+    tracker = IntradayTracker(lambda instrument: None)
+    tracker.update('AMXL', bars([0, 1, 2], [10, 11, 12]))
+    # the bar of 10:02 was revised, 10:03 and 10:04 are new
+    delta = tracker.update('AMXL', bars([0, 1, 2, 3, 4],
+                                        [10, 11, 12.5, 13, 14]))
+    assert minutes(delta) == [2, 3, 4]
+    assert delta['close'].tolist() == [12.5, 13, 14]
+    assert tracker.bars('AMXL')['close'].tolist() == [10, 11, 12.5, 13, 14]
+
+
+def test_unchanged_polls_have_no_delta():
+    tracker = IntradayTracker(lambda instrument: None)
+    updates = []
+    tracker.subscribe(lambda *update: updates.append(update))
+    tracker.update('AMXL', bars([0, 1], [10, np.nan]))
+    # the missing close that is still missing isn't a change
+    assert tracker.update('AMXL', bars([0, 1], [10, np.nan])) is None
+    assert len(updates) == 1
+
+
+def test_only_the_revision_window_is_compared():
+    tracker = IntradayTracker(lambda instrument: None, revision_window=2)
+    tracker.update('AMXL', bars([0, 1, 2, 3], [10, 11, 12, 13]))
+    # 10:00 is out of the window, its revision is ignored
+    delta = tracker.update('AMXL', bars([0, 1, 2, 3], [9, 11, 12, 13.5]))
+    assert minutes(delta) == [3]
+    assert tracker.bars('AMXL')['close'].tolist() == [10, 11, 12, 13.5]
+
+
+def test_bars_without_time_are_dropped():
+    tracker = IntradayTracker(lambda instrument: None)
+    columns = bars([0, 1], [10, 11])
+    columns['date'][1] = np.datetime64('NaT')
+    tracker.update('AMXL', columns)
+    assert tracker.bars('AMXL')['close'].tolist() == [10]
+    assert tracker.last_time('AMXL') == columns['date'][0]
+
+
+def test_poll_skips_the_failed_fetches():
+    polls = {'AMXL': bars([0], [10])}
+
+    def fetch(instrument):
+        if instrument == 'GMEXICO':
+            raise RuntimeError("timeout")
+        return polls[instrument]
+    tracker = IntradayTracker(fetch)
+    deltas = tracker.poll(['AMXL', 'GMEXICO'])
+    assert list(deltas) == ['AMXL']
+    assert tracker.poll(['AMXL']) == {}
+    tracker.forget('AMXL')
+    assert tracker.bars('AMXL') is None
@@ -0,0 +1,78 @@
+import pytest
+
+from gbm.monitor import ChangeSet, MarketMonitor, SnapshotDiffer
+
+pytest.importorskip('numpy')
+
+
+def row(issue_id, price, volume=100, benchmark='IPC'):
+    return {'issueID': issue_id, 'lastPrice': price, 'volume': volume,
+            'benchmark': benchmark}
+
+
+def test_the_first_snapshot_is_all_added():
+    differ = SnapshotDiffer()
+    rows = [row('AMXL', 14.5), row('WALMEX', 70.1)]
+    change_set = differ.diff(rows)
+    assert change_set == ChangeSet(
+        {'AMXL': rows[0], 'WALMEX': rows[1]}, {}, []
+    )
+    assert differ.snapshot() is rows
+
+
+def test_added_updated_and_removed_rows():
+    differ = SnapshotDiffer()
+    differ.diff([row('AMXL', 14.5), row('WALMEX', 70.1),
+                 row('GMEXICO', 90.0)])
+    new = row('BIMBO', 60.0)
+    change_set = differ.diff([
+        row('WALMEX', 70.1), row('AMXL', 14.6, 200, 'FTSE'), new
+    ])
+    assert change_set.added == {'BIMBO': new}
+    # only the keys that changed
+    assert change_set.updated == {
+        'AMXL': {'lastPrice': 14.6, 'volume': 200, 'benchmark': 'FTSE'}
+    }
+    assert change_set.removed == ['GMEXICO']
+
+
+def test_missing_values_that_are_still_missing_are_not_changes():
+    differ = SnapshotDiffer()
+    differ.diff([row('AMXL', None), row('WALMEX', 70.1)])
+    assert differ.diff([row('AMXL', None), row('WALMEX', 70.1)]) == (
+        ChangeSet({}, {}, [])
+    )
+    assert differ.diff([row('AMXL', 14.5), row('WALMEX', None)]).updated == {
+        'AMXL': {'lastPrice': 14.5}, 'WALMEX': {'lastPrice': None}
+    }
+
+
+def test_the_same_rows_are_not_compared():
+    differ = SnapshotDiffer()
+    rows = [row('AMXL', 14.5)]
+    differ.diff(rows)
+    assert differ.diff(rows) == ChangeSet({}, {}, [])
+
+
+class FakeMarket:
+
+    def __init__(self, snapshots):
+        self.snapshots = snapshots
+
+    def market_price_monitor_detail(self, instrument_type):
+        return self.snapshots[instrument_type].pop(0)
+
+
+def test_market_monitor_sends_the_changes():
+    market = FakeMarket({
+        0: [[row('AMXL', 14.5)], [row('AMXL', 14.5)]],
+        2: [[row('NAFTRAC', 50.0)], [row('NAFTRAC', 50.5)]],
+    })
+    monitor = MarketMonitor(market)
+    updates = []
+    monitor.subscribe(lambda *update: updates.append(update))
+    assert set(monitor.poll()) == {0, 2}
+    changes = monitor.poll()
+    assert list(changes) == [2]
+    assert changes[2].updated == {'NAFTRAC': {'lastPrice': 50.5}}
+    assert len(updates) == 3
@@ -0,0 +1,125 @@
+import datetime
+import threading
+
+import pytest
+
+from gbm.concurrency import AdaptiveSize
+from gbm.exceptions import APIError
+from gbm.old_digital_api import api
+
+
+class FakeMarket(api.Market):
+    """
+    A Market whose daily bars are one row per day, failing with the
+    status of fail(start, end) if it returns one.
+    """
+
+    def __init__(self, fail=lambda start, end: None):
+        super().__init__()
+        self.fail = fail
+        self.calls = []
+        self.historic_chunk_days = AdaptiveSize(365, 30, 3650)
+        self._lock = threading.Lock()
+
+    def capital_market_historic_price(self, issue_id, instrument_type,
+                                      start_date, end_date, output='json'):
+        start = datetime.datetime.fromisoformat(start_date)
+        end = datetime.datetime.fromisoformat(end_date)
+        with self._lock:
+            self.calls.append((start, end))
+        status = self.fail(start, end)
+        if status is not None:
+            raise APIError(status, 'error')
+        days = (end - start).days
+        return [
+            {'date': (start + datetime.timedelta(days=day)).isoformat()}
+            for day in range(days + 1)
+        ]
+
+
+def test_chunks_are_merged_without_the_boundaries():
+    market = FakeMarket()
+    rows = market.chunked_historic_price(
+        'AMXL', 0, '2010-01-01T00:00:00', '2012-01-01T00:00:00'
+    )
+    dates = [row['date'] for row in rows]
+    assert len(dates) == len(set(dates)) == 731
+    assert dates == sorted(dates)
+    assert len(market.calls) > 1
+
+
+def test_client_errors_are_raised_right_away():
+    market = FakeMarket(lambda start, end: 400)
+    with pytest.raises(APIError):
+        market.chunked_historic_price(
+            'BAD', 0, '2010-01-01T00:00:00', '2020-01-01T00:00:00',
+            max_workers=1
+        )
+    assert len(market.calls) == 1
+    assert market.historic_chunk_days.size == 365
+
+
+def test_server_errors_are_split_and_fetched_again():
+    failed = []
+
+    def fail(start, end):
+        # the first request of the range fails once
+        if not failed and (end - start).days > 100:
+            failed.append(start)
+            return 503
+    market = FakeMarket(fail)
+    rows = market.chunked_historic_price(
+        'AMXL', 0, '2010-01-01T00:00:00', '2011-01-01T00:00:00',
+        max_workers=1
+    )
+    assert len(rows) == 366
+    # the failed chunk and its two halves
+    assert len(market.calls) == 3
+
+
+class FakePortfolio(api.Portfolio):
+    """
+    A Portfolio of count transactions, with pages of at most cap rows.
+    """
+
+    def __init__(self, count, cap):
+        super().__init__()
+        self.count = count
+        self.cap = cap
+        self.calls = []
+
+    def transactions(self, contract_id, process_date, start_date, end_date,
+                     output='json', page_index=0, page_size=10, **params):
+        self.calls.append((page_index, page_size))
+        size = min(page_size, self.cap)
+        first = page_index * size
+        rows = [{'transactionsId': number + 1}
+                for number in range(first, min(first + size, self.count))]
+        # the empty response
+        return rows or {'transactionsId': 0, 'transactionTypeId': 0,
+                        'transactionsRowNumber': 0}
+
+
+def transaction_ids(portfolio, **kwargs):
+    return [row['transactionsId'] for row in portfolio.iter_transactions(
+        '00000', '2016-07-23T05:00:00Z', '2016-07-24T04:59:59Z', **kwargs
+    )]
+
+
+def test_transactions_are_paged_until_a_short_page():
+    portfolio = FakePortfolio(1200, cap=1000)
+    assert transaction_ids(portfolio) == list(range(1, 1201))
+    assert all(size == 500 for _, size in portfolio.calls)
+
+
+def test_the_page_size_follows_the_cap_of_the_server():
+    portfolio = FakePortfolio(1000, cap=100)
+    assert transaction_ids(portfolio, prefetch=2) == list(range(1, 1001))
+    assert portfolio.calls[0] == (0, 500)
+    assert all(size == 100 for _, size in portfolio.calls[1:])
+
+
+def test_a_single_short_page():
+    portfolio = FakePortfolio(250, cap=1000)
+    assert transaction_ids(portfolio) == list(range(1, 251))
+    assert transaction_ids(FakePortfolio(0, cap=1000)) == []
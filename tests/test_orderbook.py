@@ -0,0 +1,79 @@
+import pytest
+
+from gbm.orderbook import OrderBooks, cumulative_depth, imbalance
+
+np = pytest.importorskip('numpy')
+
+
+def level(sequence, bid, bid_volume, ask, ask_volume):
+    return {'sequence': sequence, 'buyNumOrders': 1, 'buyPrice': bid,
+            'buyVolume': bid_volume, 'sellNumOrders': 1, 'sellPrice': ask,
+            'sellVolume': ask_volume}
+
+
+SNAPSHOT = [
+    level(1, 10.0, 100, 10.5, 300),
+    level(2, 9.5, 200, 11.0, 100),
+    # an empty bid level, in 0
+    level(3, 0, 0, 11.5, 100),
+]
+
+
+def test_apply_returns_the_changed_levels():
+    books = OrderBooks(depth=3)
+    assert books.apply('AMXL', SNAPSHOT).tolist() == [0, 1, 2]
+    assert books.apply('AMXL', SNAPSHOT).tolist() == []
+    changed = books.apply('AMXL', [SNAPSHOT[0], level(2, 9.5, 250, 11.0, 100),
+                                   SNAPSHOT[2]])
+    assert changed.tolist() == [1]
+    book = books.book('AMXL')
+    assert book.bid_volume[1] == 250
+    assert np.isnan(book.bid_price[2])
+
+
+def test_the_metrics_of_a_book():
+    books = OrderBooks(depth=3)
+    books.apply('AMXL', SNAPSHOT)
+    book = books.book('AMXL')
+    assert (book.best_bid, book.best_ask) == (10.0, 10.5)
+    assert book.spread == 0.5
+    assert book.mid_price == 10.25
+    # closer to the bid, the side with less volume
+    assert book.microprice == pytest.approx((10.0 * 300 + 10.5 * 100) / 400)
+    bids = 100 + 200 / 2
+    asks = 300 + 100 / 2 + 100 / 3
+    assert book.imbalance() == pytest.approx((bids - asks) / (bids + asks))
+    assert book.cumulative_depth('bid').tolist() == [100, 300, 300]
+    assert book.cumulative_depth('ask').tolist() == [300, 400, 500]
+
+
+def test_the_metrics_of_all_the_books():
+    books = OrderBooks(depth=3, capacity=1)
+    books.apply('AMXL', SNAPSHOT)
+    books.apply('WALMEX', [level(1, 70.0, 100, 70.2, 100)])
+    # the arrays grew past the capacity
+    assert len(books) == 2 and 'WALMEX' in books
+    metrics = books.metrics()
+    assert metrics['best_bid'].tolist() == [10.0, 70.0]
+    assert metrics['spread'] == pytest.approx([0.5, 0.2])
+    assert metrics['imbalance'][1] == 0
+    assert books.metrics(['WALMEX'])['mid_price'] == pytest.approx([70.1])
+
+
+def test_the_imbalance_of_an_empty_book_is_nan():
+    empty = np.full((2, 3), np.nan)
+    assert np.isnan(imbalance(empty, empty)).all()
+    assert cumulative_depth(empty).tolist() == [[0, 0, 0], [0, 0, 0]]
+
+
+def test_poll_skips_the_failed_fetches():
+    class FakeMarket:
+        def l2_market_data(self, instrument):
+            if instrument == 'GMEXICO':
+                raise RuntimeError("timeout")
+            return SNAPSHOT
+
+    books = OrderBooks(depth=3)
+    changes = books.poll(FakeMarket(), ['AMXL', 'GMEXICO'])
+    assert list(changes) == ['AMXL']
+    assert books.poll(FakeMarket(), ['AMXL']) == {}
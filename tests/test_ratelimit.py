@@ -0,0 +1,102 @@
+import asyncio
+import time
+
+from gbm.ratelimit import (
+    TokenBucket, async_throttled, endpoint_group, retry_after, throttled
+)
+
+
+class FakeResponse:
+
+    def __init__(self, status_code=200, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncFakeResponse(FakeResponse):
+
+    async def aclose(self):
+        self.closed = True
+
+
+def sequence(responses):
+    responses = list(responses)
+
+    def send():
+        return responses.pop(0)
+    return send
+
+
+def test_retry_after():
+    assert retry_after(FakeResponse(headers={'Retry-After': '3'})) == 3.0
+    assert retry_after(FakeResponse(headers={
+        'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'
+    })) == 0.0
+    assert retry_after(FakeResponse()) is None
+    assert retry_after(FakeResponse(headers={'Retry-After': 'soon'})) is None
+
+
+def test_endpoint_group():
+    assert endpoint_group('/markets/BMV/securities') == 'markets'
+    assert endpoint_group('accounts') == 'accounts'
+
+
+def test_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=1000.0, burst=3)
+    assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket._reserve() > 0
+
+
+def test_bucket_aimd():
+    bucket = TokenBucket(rate=10.0, min_rate=1.0, max_rate=11.0)
+    bucket.on_success()
+    bucket.on_success()
+    bucket.on_success()
+    assert bucket.rate == 11.0
+    bucket.on_throttle()
+    assert bucket.rate == 5.5
+    for _ in range(10):
+        bucket.on_throttle()
+    assert bucket.rate == 1.0
+
+
+def test_throttle_honors_retry_after():
+    bucket = TokenBucket()
+    bucket.on_throttle(wait=0.2)
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.15
+
+
+def test_throttled_retries_and_closes_the_throttled_responses():
+    throttled_rsp = FakeResponse(429, {'Retry-After': '0'})
+    ok = FakeResponse(200)
+    bucket = TokenBucket(rate=1000.0)
+    assert throttled(bucket, sequence([throttled_rsp, ok])) is ok
+    assert throttled_rsp.closed
+    assert not ok.closed
+
+
+def test_throttled_returns_the_last_response():
+    responses = [FakeResponse(503, {'Retry-After': '0'}) for _ in range(3)]
+    bucket = TokenBucket(rate=1000.0, min_rate=500.0)
+    assert throttled(bucket, sequence(responses), max_retries=2) is (
+        responses[-1]
+    )
+    assert [rsp.closed for rsp in responses] == [True, True, False]
+
+
+def test_async_throttled_closes_the_throttled_responses():
+    throttled_rsp = AsyncFakeResponse(429, {'Retry-After': '0'})
+    ok = AsyncFakeResponse(200)
+    responses = [throttled_rsp, ok]
+
+    async def send():
+        return responses.pop(0)
+    bucket = TokenBucket(rate=1000.0)
+    assert asyncio.run(async_throttled(bucket, send)) is ok
+    assert throttled_rsp.closed
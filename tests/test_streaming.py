@@ -0,0 +1,124 @@
+import asyncio
+
+import pytest
+
+from gbm.streaming import (
+    LocalBroker, Message, StreamSubscriber, decode_payload, matches,
+    resolve_topics
+)
+from gbm.streaming.topics import service
+
+L2 = 'dat/GBM/R/L2/MEX/E/BMV/AMXL'
+MDWEB = 'dat/GBM/R/MDWEB/MEX/E/BMV/NAC/AMXL'
+
+
+@pytest.mark.parametrize('subscription, topic, expected', [
+    (L2, L2, True),
+    ('dat/GBM/R/L2/MEX/E/BMV/*', L2, True),
+    ('dat/GBM/R/L2/MEX/E/BMV/AM*', L2, True),
+    ('dat/GBM/R/L2/MEX/E/BMV/WAL*', L2, False),
+    ('dat/GBM/R/*/MEX/E/BMV/AMXL', L2, True),
+    # '*' is a single level
+    ('dat/GBM/R/L2/*', L2, False),
+    ('dat/GBM/R/>', L2, True),
+    ('dat/GBM/R/>', MDWEB, True),
+    # '>' is one level at least and only at the end
+    ('dat/GBM/R/L2/MEX/E/BMV/AMXL/>', L2, False),
+    ('dat/>/L2/MEX/E/BMV/AMXL', L2, False),
+    # the rest of the characters are literal
+    ('dat/GBM/R/L2/MEX/E/BMV/AMX.', L2, False),
+])
+def test_matches(subscription, topic, expected):
+    assert matches(subscription, topic) is expected
+
+
+def test_service():
+    assert service(L2) == 'L2'
+    assert service(MDWEB) == 'MDWEB'
+    assert service('dat/GBM') is None
+
+
+def test_resolve_topics():
+    class FakeAppManagement:
+        def solace_topic(self, **kwargs):
+            return {'dataSubscription': [L2], 'kwargs': kwargs}
+
+    assert resolve_topics(FakeAppManagement(), 'l2') == [L2]
+    with pytest.raises(ValueError):
+        resolve_topics(FakeAppManagement(), 'trades')
+
+
+def test_local_broker_delivers_to_the_subscribed_transports():
+    broker = LocalBroker()
+    l2 = StreamSubscriber(broker.transport())
+    monitor = StreamSubscriber(broker.transport())
+    l2_messages, monitor_messages = [], []
+    l2.subscribe('dat/GBM/R/L2/>', l2_messages.append)
+    monitor.subscribe('dat/GBM/R/MDWEB/>', monitor_messages.append)
+    monitor.subscribe('dat/GBM/R/*/MEX/E/BMV/NAC/*', monitor_messages.append)
+    assert broker.publish(L2, [{'sequence': 1}]) == 1
+    assert broker.publish(MDWEB, b'{"issueID": "AMXL"}') == 1
+    assert l2_messages == [Message(L2, [{'sequence': 1}])]
+    # once per matching subscription
+    assert monitor_messages == [Message(MDWEB, {'issueID': 'AMXL'})] * 2
+    assert broker.publish('dat/GBM/R/INDEXES/IPC', {}) == 0
+
+
+def test_unsubscribed_and_closed_transports_receive_nothing():
+    broker = LocalBroker()
+    subscriber = StreamSubscriber(broker.transport())
+    messages = []
+    subscriber.subscribe(L2, messages.append)
+    subscriber.unsubscribe(L2, messages.append)
+    assert subscriber.transport.subscriptions == set()
+    assert broker.publish(L2, {}) == 0
+    subscriber.subscribe(L2, messages.append)
+    subscriber.close()
+    assert broker.publish(L2, {}) == 0
+    assert messages == []
+
+
+def test_failing_callbacks_and_payloads_are_skipped():
+    broker = LocalBroker()
+    subscriber = StreamSubscriber(broker.transport())
+    messages = []
+
+    def fail(message):
+        raise RuntimeError("callback")
+    subscriber.subscribe(L2, fail)
+    subscriber.subscribe(L2, messages.append)
+    broker.publish(L2, b'not json')
+    broker.publish(L2, {'sequence': 1})
+    assert messages == [Message(L2, {'sequence': 1})]
+
+
+def test_decode_payload():
+    payload = (b'[{"sequence": 1, "buyNumOrders": 2, "buyPrice": 14.5, '
+               b'"buyVolume": 100, "sellNumOrders": 1, "sellPrice": 14.6, '
+               b'"sellVolume": 200}]')
+    assert decode_payload(L2, payload, 'bytes') is payload
+    levels = decode_payload(L2, payload, 'records')
+    assert levels[0].sequence == 1 and levels[0].extra is None
+    # the topics of other services are kept as JSON
+    assert decode_payload('dat/GBM/R/INDEXES/IPC', b'{"a": 1}',
+                          'records') == {'a': 1}
+    with pytest.raises(ValueError):
+        decode_payload(L2, payload, 'rows')
+
+
+def test_async_messages():
+    broker = LocalBroker()
+    subscriber = StreamSubscriber(broker.transport())
+
+    async def receive():
+        messages = subscriber.messages(L2)
+        first = asyncio.ensure_future(messages.__anext__())
+        # the subscription is made on the first iteration
+        await asyncio.sleep(0)
+        broker.publish(L2, {'sequence': 1})
+        message = await first
+        await messages.aclose()
+        return message
+
+    assert asyncio.run(receive()) == Message(L2, {'sequence': 1})
+    assert subscriber.transport.subscriptions == set()
@@ -0,0 +1,84 @@
+import pytest
+
+from gbm.tape import Gap, Tape, Tapes
+
+pytest.importorskip('numpy')
+
+
+def trade(sequence, price=10.0, volume=100):
+    return {
+        'sequence': sequence,
+        'time': '2023-03-01T10:00:{:02d}-06:00'.format(sequence % 60),
+        'last': price,
+        'operationVolume': volume,
+        'buyer': 'GBM',
+        'seller': 'ACCI',
+    }
+
+
+def sequences(trades):
+    return [trade['sequence'] for trade in trades]
+
+
+def test_overlapping_windows_are_counted_once():
+    tape = Tape('AMXL')
+    new, gaps = tape.add([trade(1), trade(2, 11.0), trade(3)])
+    assert sequences(new) == [1, 2, 3] and gaps == []
+    new, gaps = tape.add([trade(2, 11.0), trade(3), trade(4, 12.0, 200)])
+    assert sequences(new) == [4] and gaps == []
+    assert tape.trade_count == 4
+    assert tape.volume == 500
+    assert tape.vwap == pytest.approx((10 + 11 + 10 + 2 * 12) * 100 / 500)
+    assert (tape.low, tape.high, tape.last_price) == (10.0, 12.0, 12.0)
+    assert tape.trades()['sequence'].tolist() == [1, 2, 3, 4]
+
+
+def test_a_window_without_overlap_is_a_gap():
+    tape = Tape('AMXL')
+    tape.add([trade(1), trade(2)])
+    new, gaps = tape.add([trade(7), trade(8)])
+    assert sequences(new) == [7, 8]
+    assert gaps == [Gap(2, 7)]
+
+
+def test_contiguous_holes_are_gaps():
+    tape = Tape('AMXL', contiguous=True)
+    assert tape.add([trade(5), trade(6)])[1] == []
+    # overlapping, but 7 is missing
+    new, gaps = tape.add([trade(6), trade(8), trade(9), trade(12)])
+    assert sequences(new) == [8, 9, 12]
+    assert gaps == [Gap(6, 8), Gap(9, 12)]
+
+
+def test_late_trades_are_not_gaps():
+    tape = Tape('AMXL', contiguous=True)
+    tape.add([trade(5), trade(8)])
+    new, gaps = tape.add([trade(7), trade(8)])
+    assert sequences(new) == [7]
+    assert gaps == []
+
+
+def test_evicted_trades_are_still_seen():
+    tape = Tape('AMXL', capacity=2)
+    tape.add([trade(1), trade(2), trade(3)])
+    assert tape.trades()['sequence'].tolist() == [2, 3]
+    new, _ = tape.add([trade(1), trade(2), trade(3), trade(4)])
+    assert sequences(new) == [4]
+    assert tape.trade_count == 4
+
+
+def test_tapes_poll():
+    windows = {'AMXL': [trade(1), trade(2)], 'WALMEX': [trade(5)]}
+
+    def fetch(instrument):
+        if instrument == 'GMEXICO':
+            raise RuntimeError("timeout")
+        return windows[instrument]
+    tapes = Tapes(fetch)
+    updates = []
+    tapes.subscribe(lambda *update: updates.append(update))
+    assert tapes.poll(['AMXL', 'WALMEX', 'GMEXICO']) == {}
+    assert sorted(update[0] for update in updates) == ['AMXL', 'WALMEX']
+    windows['AMXL'] = [trade(9)]
+    assert tapes.poll(['AMXL', 'WALMEX']) == {'AMXL': [Gap(2, 9)]}
+    assert tapes.tape('AMXL').trade_count == 3
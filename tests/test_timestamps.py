@@ -0,0 +1,55 @@
+import datetime
+
+import pytest
+
+from gbm.timestamps import is_timestamp, parse_time, to_datetimes
+
+UTC = datetime.timezone.utc
+
+VALUES = [
+    '2016-07-18T00:00:00-05:00',
+    '2016-08-10T14:59:32.183-05:00',
+    '2016-07-27T09:18:27.1489496-05:00',
+    '2020-02-29T23:59:59Z',
+    '2021-01-01T00:00:00',
+    '2021-03-04',
+    '0001-01-01T00:00:00',
+    None,
+]
+
+EXPECTED = [
+    datetime.datetime(2016, 7, 18, 5, tzinfo=UTC),
+    datetime.datetime(2016, 8, 10, 19, 59, 32, 183000, tzinfo=UTC),
+    datetime.datetime(2016, 7, 27, 14, 18, 27, 148949, tzinfo=UTC),
+    datetime.datetime(2020, 2, 29, 23, 59, 59, tzinfo=UTC),
+    datetime.datetime(2021, 1, 1, tzinfo=UTC),
+    datetime.datetime(2021, 3, 4, tzinfo=UTC),
+    None,
+    None,
+]
+
+
+def test_parse_time():
+    assert [parse_time(value) for value in VALUES] == EXPECTED
+
+
+def test_is_timestamp():
+    assert is_timestamp('2016-07-18T00:00:00-05:00')
+    assert is_timestamp('2021-03-04')
+    assert not is_timestamp('AMXL')
+
+
+def test_to_datetimes():
+    assert to_datetimes(VALUES) == EXPECTED
+
+
+def test_parse_times_matches_parse_time():
+    np = pytest.importorskip('numpy')
+    from gbm.timestamps import parse_epoch, parse_times
+    parsed = parse_times(VALUES)
+    assert parsed.dtype == np.dtype('datetime64[ns]')
+    assert parsed[2] == np.datetime64('2016-07-27T14:18:27.1489496', 'ns')
+    assert np.isnat(parsed[-2:]).all()
+    assert parse_epoch(VALUES[:1], 's').tolist() == [
+        int(EXPECTED[0].timestamp())
+    ]
@@ -0,0 +1,230 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+import gbm.transport
+from gbm.api import AsyncGBMAPIv2
+from gbm.cache import ValidatorStore
+from gbm.transport import (
+    AsyncHTTPTransport, HostLimits, HTTPTransport, PooledSession
+)
+
+CHALLENGE = b'<html><script src="/_Incapsula_Resource?x=1"></script></html>'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    challenges = 0
+    delay = 0
+
+    def reply(self, status, body=b'', content_type='application/json',
+              headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        path = self.path.split('?')[0]
+        if path == '/challenged' and Handler.challenges:
+            Handler.challenges -= 1
+            self.reply(200, CHALLENGE, 'text/html')
+        elif path.endswith('/intraday-trade-aggregates'):
+            # /markets/<exchange>/securities/<security>/...
+            security = path.split('/')[-2]
+            etag = '"{}"'.format(security)
+            if security == 'ERR':
+                self.reply(500, b'{"error": "boom"}')
+            elif self.headers.get('If-None-Match') == etag:
+                self.reply(304)
+            else:
+                body = json.dumps([{'security': security, 'close': 1.5}])
+                self.reply(200, body.encode(), headers=[('ETag', etag)])
+        elif path.endswith('/intraday-trades'):
+            body = json.dumps([{'price': price} for price in range(3)])
+            self.reply(200, body.encode())
+        else:
+            body = b'{"cookie": "%s"}' % (
+                self.headers.get('Cookie') or ''
+            ).encode()
+            self.reply(200, body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.05,), daemon=True
+    )
+    thread.start()
+    yield 'http://127.0.0.1:{}'.format(httpd.server_port)
+    httpd.shutdown()
+    Handler.challenges = 0
+    Handler.delay = 0
+
+
+class FakeDriver:
+
+    def __init__(self):
+        self.harvests = 0
+
+    def get(self, url):
+        pass
+
+    def execute_script(self, script):
+        return 'test-agent'
+
+    def get_cookies(self):
+        self.harvests += 1
+        return [{'name': 'visid', 'value': str(self.harvests),
+                 'domain': '127.0.0.1'}]
+
+
+def test_is_challenge():
+    class Response:
+        def __init__(self, content, content_type):
+            self.content = content
+            self.headers = {'Content-Type': content_type}
+    assert gbm.transport.is_challenge(Response(CHALLENGE, 'text/html'))
+    assert not gbm.transport.is_challenge(
+        Response(CHALLENGE, 'application/json')
+    )
+    assert not gbm.transport.is_challenge(Response(b'[]', 'text/html'))
+
+
+def test_pooled_session_caps_the_in_flight_requests(server):
+    Handler.delay = 0.2
+    pooled = PooledSession({server: HostLimits(4, 2)})
+    threads = [
+        threading.Thread(target=pooled.request, args=('GET', server + '/'))
+        for _ in range(6)
+    ]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    stats = pooled.pool_stats()[server]
+    while stats['in_flight'] + stats['waiters'] < 6:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+        stats = pooled.pool_stats()[server]
+    assert stats['in_flight'] == 2
+    assert stats['waiters'] == 4
+    for thread in threads:
+        thread.join()
+    stats = pooled.pool_stats()[server]
+    assert stats['requests'] == 6
+    assert stats['in_flight'] == 0
+    assert stats['new_connections'] <= 2
+    pooled.close()
+
+
+def test_http_transport_reharvests_when_challenged(server):
+    driver = FakeDriver()
+    transport = HTTPTransport(lambda: driver, persist_cookies=False)
+    rsp = transport.request('GET', server + '/')
+    assert rsp.json() == {'cookie': 'visid=1'}
+    Handler.challenges = 1
+    rsp = transport.request('GET', server + '/challenged')
+    assert rsp.json() == {'cookie': 'visid=2'}
+    assert transport.pool_stats()[server]['requests'] == 3
+    transport.close()
+
+
+class Session:
+    user = 'test'
+    auth_access_header = 'Bearer token'
+
+
+def async_api(server, driver):
+    transport = AsyncHTTPTransport(lambda: driver, persist_cookies=False)
+    api = AsyncGBMAPIv2(Session(), transport)
+    api._url_builder = lambda url_segment: server + url_segment
+    api.validators = ValidatorStore()
+    return api
+
+
+def test_async_transport_reharvests_when_challenged(server):
+    pytest.importorskip('httpx')
+    driver = FakeDriver()
+
+    async def run():
+        transport = AsyncHTTPTransport(lambda: driver, persist_cookies=False)
+        first = await transport.request('GET', server + '/')
+        Handler.challenges = 1
+        second = await transport.request('GET', server + '/challenged')
+        stats = transport.pool_stats()[server]
+        await transport.aclose()
+        return first.json(), second.json(), stats
+    first, second, stats = asyncio.run(run())
+    assert first == {'cookie': 'visid=1'}
+    assert second == {'cookie': 'visid=2'}
+    assert stats['requests'] == 3
+
+
+def test_async_conditional_requests(server):
+    pytest.importorskip('httpx')
+
+    async def run(api):
+        rows = await api.intraday_trade_aggregates('BMV', 'AMXL', '1d')
+        again = await api.intraday_trade_aggregates('BMV', 'AMXL', '1d')
+        await api.driver.aclose()
+        return rows, again
+    api = async_api(server, FakeDriver())
+    rows, again = asyncio.run(run(api))
+    assert rows == [{'security': 'AMXL', 'close': 1.5}]
+    assert again is rows
+    assert api.validators.not_modified == 1
+
+
+def test_async_not_modified_without_a_stored_value(server):
+    pytest.importorskip('httpx')
+    api = async_api(server, FakeDriver())
+    # validators of a value that is no longer stored
+    api.validators.headers = lambda key: {'If-None-Match': '"AMXL"'}
+
+    async def run():
+        rows = await api.intraday_trade_aggregates('BMV', 'AMXL', '1d')
+        await api.driver.aclose()
+        return rows
+    assert asyncio.run(run()) == [{'security': 'AMXL', 'close': 1.5}]
+
+
+def test_async_stream(server):
+    pytest.importorskip('httpx')
+
+    async def run(api):
+        rows = await api.index_intraday('IPC', output='stream')
+        rows = [row async for row in rows]
+        await api.driver.aclose()
+        return rows
+    rows = asyncio.run(run(async_api(server, FakeDriver())))
+    assert rows == [{'price': 0}, {'price': 1}, {'price': 2}]
+
+
+def test_async_bulk_fan_out(server):
+    pytest.importorskip('httpx')
+    pairs = [('BMV', 'AMXL'), ('BMV', 'ERR'), ('BMV', 'WALMEX')]
+
+    async def run(api):
+        results = [result async for result in
+                   api.bulk_intraday_trade_aggregates(pairs, '1d')]
+        await api.driver.aclose()
+        return results
+    results = {
+        result.key: result
+        for result in asyncio.run(run(async_api(server, FakeDriver())))
+    }
+    assert set(results) == set(pairs)
+    assert results[('BMV', 'WALMEX')].value[0]['security'] == 'WALMEX'
+    assert results[('BMV', 'ERR')].error.status_code == 500
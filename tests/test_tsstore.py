@@ -0,0 +1,116 @@
+import datetime
+
+import pytest
+
+import gbm.columnar
+from gbm.tsstore import HistoricStore, merge_ranges, missing_ranges
+
+np = pytest.importorskip('numpy')
+
+
+def day(value):
+    return np.datetime64(value, 'D')
+
+
+class FakeMarket:
+    """
+    One bar per day, with the close of the day of the month plus the
+    number of the fetch.
+    """
+
+    def __init__(self):
+        self.fetched = []
+
+    def capital_market_historic_price(self, issue_id, instrument_type,
+                                      start_date, end_date, output='json'):
+        start = datetime.date.fromisoformat(start_date[:10])
+        end = datetime.date.fromisoformat(end_date[:10])
+        self.fetched.append((str(start), str(end)))
+        rows = [{
+            'date': (start + datetime.timedelta(days=days)).isoformat()
+            + 'T00:00:00Z',
+            'closePrice': (start + datetime.timedelta(days=days)).day
+            + len(self.fetched) / 100,
+        } for days in range((end - start).days + 1)]
+        return gbm.columnar.convert(rows, output, gbm.columnar.BARS)
+
+
+def test_merge_ranges():
+    assert merge_ranges([
+        (day('2020-01-05'), day('2020-01-09')),
+        (day('2020-01-01'), day('2020-01-04')),
+        (day('2020-01-20'), day('2020-01-25')),
+        (day('2020-01-21'), day('2020-01-22')),
+    ]) == [
+        (day('2020-01-01'), day('2020-01-09')),
+        (day('2020-01-20'), day('2020-01-25')),
+    ]
+
+
+def test_missing_ranges():
+    covered = [(day('2020-01-05'), day('2020-01-09')),
+               (day('2020-01-20'), day('2020-01-25'))]
+    assert missing_ranges(covered, day('2020-01-01'), day('2020-01-31')) == [
+        (day('2020-01-01'), day('2020-01-04')),
+        (day('2020-01-10'), day('2020-01-19')),
+        (day('2020-01-26'), day('2020-01-31')),
+    ]
+    assert missing_ranges(covered, day('2020-01-06'), day('2020-01-08')) == []
+    assert missing_ranges([], day('2020-01-01'), day('2020-01-02')) == [
+        (day('2020-01-01'), day('2020-01-02'))
+    ]
+
+
+def test_only_the_missing_ranges_are_fetched(tmp_path):
+    market = FakeMarket()
+    store = HistoricStore(market, str(tmp_path))
+    bars = store.bars('AMXL', 0, '2020-01-10', '2020-01-19')
+    assert len(bars['date']) == 10
+    bars = store.bars('AMXL', 0, '2020-01-12', '2020-01-14')
+    assert bars['close'].tolist() == [12.01, 13.01, 14.01]
+    assert market.fetched == [('2020-01-10', '2020-01-19')]
+    assert store.missing('AMXL', 0, '2020-01-01', '2020-01-31') == [
+        (day('2020-01-01'), day('2020-01-09')),
+        (day('2020-01-20'), day('2020-01-31')),
+    ]
+
+
+def test_appended_and_rewritten_bars(tmp_path):
+    market = FakeMarket()
+    store = HistoricStore(market, str(tmp_path))
+    store.bars('AMXL', 0, '2020-01-10', '2020-01-19')
+    # after the last stored bar, appended to the column files
+    store.bars('AMXL', 0, '2020-01-10', '2020-01-25')
+    # before the first one, the column files are rewritten in order
+    bars = store.bars('AMXL', 0, '2020-01-01', '2020-01-31')
+    assert market.fetched == [
+        ('2020-01-10', '2020-01-19'), ('2020-01-20', '2020-01-25'),
+        ('2020-01-01', '2020-01-09'), ('2020-01-26', '2020-01-31'),
+    ]
+    assert bars['date'].tolist() == np.arange(
+        '2020-01-01', '2020-02-01', dtype='datetime64[D]'
+    ).astype('datetime64[ns]').tolist()
+    assert bars['close'][:9].tolist() == [
+        number + 0.03 for number in range(1, 10)
+    ]
+    assert bars['close'][9:25].tolist() == [
+        number + (0.01 if number < 20 else 0.02) for number in range(10, 26)
+    ]
+    # a new store reads the same files
+    again = HistoricStore(market, str(tmp_path)).bars(
+        'AMXL', 0, '2020-01-01', '2020-01-31'
+    )
+    assert again['close'].tolist() == bars['close'].tolist()
+    assert len(market.fetched) == 4
+
+
+def test_the_bars_of_today_are_fetched_again(tmp_path):
+    market = FakeMarket()
+    store = HistoricStore(market, str(tmp_path))
+    today = datetime.date.today()
+    start = today - datetime.timedelta(days=2)
+    store.bars('AMXL', 0, start, today)
+    bars = store.bars('AMXL', 0, start, today)
+    assert market.fetched[1] == (str(today), str(today))
+    assert len(bars['date']) == 3
+    assert bars['close'][-1] == today.day + 0.02